@@ -0,0 +1,187 @@
+from pyGSW.utils import RandomUtils
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import asyncio
+
+
+class AsyncGSW(object):
+    """Asyncio front end for GSW encryption and decryption. Concurrent requests are collected
+    into micro-batches, every batch is executed by one matrix production in executor
+
+    :arg keys: GSW parameters and bonded secret and public keys
+    :type keys: GSWKeys
+    :arg max_batch_size: max number of requests in one batch
+    :type max_batch_size: int
+    :arg max_wait: max time in seconds, that first request of batch waits for other requests
+    :type max_wait: float
+    :arg executor: executor for batches. Own thread pool is used if None
+    :type executor: concurrent.futures.Executor
+    :arg rng: random generator or seed for encryption. Encryption batches are executed one by one
+    :type rng: np.random.Generator
+    :return: None
+    """
+
+    def __init__(self, keys, max_batch_size: int=8, max_wait: float=0.01, executor=None, rng=None):
+        self.keys = keys
+        self.rng = RandomUtils.Generator(rng)
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        self.own_executor = executor is None
+        self.executor = ThreadPoolExecutor(max_workers=2) if executor is None else executor
+
+        self.pending = {"encrypt": deque(), "decrypt": deque()}
+        self.events = {}
+        self.workers = []
+        self.closed = False
+
+        self.batches = {operation: {"batches": 0, "requests": 0, "max_batch_size": 0}
+                        for operation in ("encrypt", "decrypt")}
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def start(self):
+        """Start batching workers in running event loop. Closed service can not be started again
+
+        :return: None
+        """
+
+        if self.closed:
+            raise RuntimeError("AsyncGSW is closed, its executor is shut down")
+        if self.workers:
+            return
+
+        self.events = {"encrypt": asyncio.Event(), "decrypt": asyncio.Event()}
+        self.workers = [
+            asyncio.ensure_future(self.worker("encrypt", lambda messages: self.keys.public_key.EncryptBatch(
+                self.keys.params, messages, self.rng))),
+            asyncio.ensure_future(self.worker("decrypt", lambda ciphertexts: self.keys.secret_key.DecryptBatch(
+                self.keys.params, ciphertexts))),
+        ]
+
+    async def close(self):
+        """Stop batching workers and cancel not finished requests, including requests of running batches
+
+        :return: None
+        """
+
+        self.closed = True
+
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+        for pending in self.pending.values():
+            while pending:
+                pending.popleft()[1].cancel()
+
+        if self.own_executor:
+            self.executor.shutdown(wait=False)
+
+    async def encrypt(self, message):
+        """Encrypting integer message in next batch
+
+        :param message: encrypting integer message
+        :type message: int
+        :return: ciphertext matrix with error bound
+        :rtype: GSWCiphertext
+        """
+
+        return await self.submit("encrypt", message)
+
+    async def decrypt(self, ciphertext):
+        """Decrypting ciphertext in next batch
+
+        :param ciphertext: ciphertext matrix
+        :type ciphertext: np.array
+        :return: decrypted value
+        :rtype: int
+        """
+
+        return await self.submit("decrypt", ciphertext)
+
+    async def submit(self, operation, item):
+        self.start()
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending[operation].append((item, future))
+        self.events[operation].set()
+
+        return await future
+
+    async def worker(self, operation, run_batch):
+        loop = asyncio.get_running_loop()
+        pending = self.pending[operation]
+        event = self.events[operation]
+
+        while True:
+            await event.wait()
+
+            # Waiting for full batch, but not longer than max_wait after first request
+            deadline = loop.time() + self.max_wait
+            while len(pending) < self.max_batch_size and loop.time() < deadline:
+                event.clear()
+                try:
+                    await asyncio.wait_for(event.wait(), deadline - loop.time())
+                except asyncio.TimeoutError:
+                    break
+
+            batch = [pending.popleft() for _ in range(min(len(pending), self.max_batch_size))]
+            batch = [(item, future) for item, future in batch if not future.cancelled()]
+            if not pending:
+                event.clear()
+            if not batch:
+                continue
+
+            counters = self.batches[operation]
+            counters["batches"] += 1
+            counters["requests"] += len(batch)
+            counters["max_batch_size"] = max(counters["max_batch_size"], len(batch))
+
+            try:
+                results = await loop.run_in_executor(self.executor, run_batch, [item for item, _ in batch])
+            except Exception as exc:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+            else:
+                for (_, future), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+            finally:
+                # Requests of batch, which is interrupted by close(), are cancelled
+                for _, future in batch:
+                    future.cancel()
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of requests, waiting for batch"""
+
+        return sum(len(pending) for pending in self.pending.values())
+
+    def stats(self) -> dict:
+        """Queue depth and batch size metrics for every operation
+
+        :return: dictionary with queue_depth, batches, requests, mean_batch_size and max_batch_size of
+            encrypt and decrypt operations
+        :rtype: dict
+        """
+
+        stats = {}
+        for operation, counters in self.batches.items():
+            stats[operation] = {
+                "queue_depth": len(self.pending[operation]),
+                "batches": counters["batches"],
+                "requests": counters["requests"],
+                "mean_batch_size": counters["requests"] / counters["batches"] if counters["batches"] else 0.0,
+                "max_batch_size": counters["max_batch_size"],
+            }
+        return stats
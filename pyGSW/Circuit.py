@@ -0,0 +1,388 @@
+from pyGSW.GSW import HomomorphicOperations
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import heapq
+import os
+
+
+def EvaluateGate(params, op, const, operands, cache=None):
+    """Evaluating one homomorphic gate
+
+    :param params: GSW scheme parameters
+    :type params: GSWParams
+    :param op: gate operation: "add", "const_mult" or "mult"
+    :type op: str
+    :param const: multiplied constant of "const_mult" gate
+    :type const: int
+    :param operands: input ciphertexts of gate
+    :type operands: list[GSWCiphertext]
+    :param cache: cache of decompositions for "mult" gates
+    :type cache: DecompositionCache
+    :return: gate result
+    :rtype: GSWCiphertext
+    """
+
+    if op == "add":
+        return HomomorphicOperations.Add(params, *operands)
+    if op == "const_mult":
+        return HomomorphicOperations.ConstMult(params, operands[0], const)
+    if op == "mult":
+        return HomomorphicOperations.Mult(params, *operands, cache=cache)
+    raise ValueError(f"Unknown gate operation {op}")
+
+
+class Gate(object):
+    """Node of homomorphic circuit
+
+    :arg op: gate operation: "input", "add", "const_mult" or "mult"
+    :type op: str
+    :arg inputs: numbers of input gates
+    :type inputs: tuple[int]
+    :arg const: multiplied constant of "const_mult" gate
+    :type const: int
+    :arg name: name of "input" gate
+    :type name: str
+    :return: None
+    """
+
+    def __init__(self, op, inputs=(), const=None, name=None):
+        self.op = op
+        self.inputs = tuple(inputs)
+        self.const = const
+        self.name = name
+
+    def __str__(self) -> str:
+        return f"{self.op}{self.inputs}" if self.name is None else f"{self.op}({self.name})"
+
+
+class Circuit(object):
+    """Builder and evaluator of homomorphic circuits. Every builder method records gate and returns its number.
+    Evaluation rebalances associative chains of Add and Mult gates into trees, runs independent gates concurrently
+    and frees intermediate ciphertexts after their last consumer. Gates spend their time in numpy operations,
+    which release GIL, so thread pool runs them on several cores
+
+    :arg params: GSW scheme parameters. Multiplicative depth of circuit must be <= params.L
+    :type params: GSWParams
+    :return: None
+    """
+
+    def __init__(self, params):
+        self.params = params
+        self.gates = []
+        self.outputs = {}
+        self.report = {}
+
+    def __str__(self) -> str:
+        return "\n".join(f"{number}: {gate}" for number, gate in enumerate(self.gates))
+
+    def Append(self, gate):
+        """Adding gate
+
+        :param gate: new gate with inputs from this circuit
+        :type gate: Gate
+        :return: gate number
+        :rtype: int
+        """
+
+        for number in gate.inputs:
+            if not 0 <= number < len(self.gates):
+                raise ValueError(f"Unknown gate {number}")
+        self.gates.append(gate)
+        return len(self.gates) - 1
+
+    def Input(self, name):
+        """Adding input ciphertext
+
+        :param name: input name, used in Evaluate
+        :type name: str
+        :return: gate number
+        :rtype: int
+        """
+
+        return self.Append(Gate("input", name=name))
+
+    def Add(self, a, b):
+        """Adding sum of two gates
+
+        :return: gate number
+        :rtype: int
+        """
+
+        return self.Append(Gate("add", (a, b)))
+
+    def ConstMult(self, a, const):
+        """Adding multiplication of gate by constant
+
+        :return: gate number
+        :rtype: int
+        """
+
+        return self.Append(Gate("const_mult", (a,), const))
+
+    def Mult(self, a, b):
+        """Adding multiplication of two gates
+
+        :return: gate number
+        :rtype: int
+        """
+
+        return self.Append(Gate("mult", (a, b)))
+
+    def Output(self, number, name):
+        """Marking gate as circuit output
+
+        :param number: gate number
+        :type number: int
+        :param name: output name, used in Evaluate result
+        :type name: str
+        :return: None
+        """
+
+        self.outputs[name] = number
+
+    def Depths(self):
+        """Multiplicative depth of every gate
+
+        :return: list of multiplicative depths
+        :rtype: list[int]
+        """
+
+        depths = []
+        for gate in self.gates:
+            depth = max((depths[number] for number in gate.inputs), default=0)
+            depths.append(depth + 1 if gate.op == "mult" else depth)
+        return depths
+
+    def Depth(self) -> int:
+        """Multiplicative depth of circuit outputs
+
+        :return: max multiplicative depth of outputs
+        :rtype: int
+        """
+
+        depths = self.Depths()
+        return max((depths[number] for number in self.outputs.values()), default=0)
+
+    def CriticalPath(self):
+        """The longest chain of gates, ending in some output. Mult gate is counted as deeper than any number of
+        Add and ConstMult gates
+
+        :return: gate numbers from input to output
+        :rtype: list[int]
+        """
+
+        depths = self.Depths()
+        lengths, previous = [], []
+        for number, gate in enumerate(self.gates):
+            best = max(gate.inputs, key=lambda i: (depths[i], lengths[i]), default=None)
+            previous.append(best)
+            lengths.append(0 if best is None else lengths[best] + 1)
+
+        number = max(self.outputs.values(), key=lambda i: (depths[i], lengths[i]), default=None)
+        path = []
+        while number is not None:
+            path.append(number)
+            number = previous[number]
+        return path[::-1]
+
+    def Consumers(self):
+        """Number of gates, using every gate as input
+
+        :return: list of consumer numbers
+        :rtype: list[int]
+        """
+
+        consumers = [0] * len(self.gates)
+        for gate in self.gates:
+            for number in gate.inputs:
+                consumers[number] += 1
+        return consumers
+
+    def Balance(self):
+        """Rebalancing chains of equal associative gates (Add or Mult) into trees with minimal depth.
+        Gate, used only by one gate with equal operation, is merged into its consumer, then operands of
+        merged gate are combined pairwise starting from the least deep ones. Combined operands keep their
+        original left to right order, and gates without merged inputs are kept unchanged
+
+        :return: equivalent circuit with only used gates
+        :rtype: Circuit
+        """
+
+        consumers = self.Consumers()
+        outputs = set(self.outputs.values())
+
+        merged = [False] * len(self.gates)
+        for number, gate in enumerate(self.gates):
+            for input_number in gate.inputs:
+                if gate.op in ("add", "mult") and self.gates[input_number].op == gate.op \
+                        and consumers[input_number] == 1 and input_number not in outputs:
+                    merged[input_number] = True
+
+        def leaves(number):
+            # Operands of merged chain from left to right
+            stack, result = list(reversed(self.gates[number].inputs)), []
+            while stack:
+                input_number = stack.pop()
+                if merged[input_number]:
+                    stack.extend(reversed(self.gates[input_number].inputs))
+                else:
+                    result.append(input_number)
+            return result
+
+        circuit = Circuit(self.params)
+        depths, lengths = [], []
+
+        def append(gate):
+            depth = max((depths[i] for i in gate.inputs), default=0)
+            depths.append(depth + 1 if gate.op == "mult" else depth)
+            lengths.append(max((lengths[i] + 1 for i in gate.inputs), default=0))
+            return circuit.Append(gate)
+
+        mapping = {}
+        for number, gate in enumerate(self.gates):
+            if merged[number]:
+                continue
+
+            if gate.op not in ("add", "mult") or not any(merged[i] for i in gate.inputs):
+                mapping[number] = append(Gate(gate.op, [mapping[i] for i in gate.inputs], gate.const, gate.name))
+                continue
+
+            # Ties are broken by position of operand in chain, combined operand takes position of its left part
+            heap = [(depths[mapping[leaf]], lengths[mapping[leaf]], position, mapping[leaf])
+                    for position, leaf in enumerate(leaves(number))]
+            heapq.heapify(heap)
+            while len(heap) > 1:
+                _, _, position_a, a = heapq.heappop(heap)
+                _, _, position_b, b = heapq.heappop(heap)
+                if position_b < position_a:
+                    position_a, a, b = position_b, b, a
+
+                c = append(Gate(gate.op, (a, b)))
+                heapq.heappush(heap, (depths[c], lengths[c], position_a, c))
+
+            mapping[number] = heap[0][3]
+
+        for name, number in self.outputs.items():
+            circuit.Output(mapping[number], name)
+
+        return circuit.Pruned()
+
+    def Pruned(self):
+        """Removing gates, which are not used by outputs
+
+        :return: equivalent circuit
+        :rtype: Circuit
+        """
+
+        used = set(self.outputs.values())
+        for number in reversed(range(len(self.gates))):
+            if number in used:
+                used.update(self.gates[number].inputs)
+
+        circuit = Circuit(self.params)
+        mapping = {}
+        for number, gate in enumerate(self.gates):
+            if number in used:
+                mapping[number] = circuit.Append(
+                    Gate(gate.op, [mapping[i] for i in gate.inputs], gate.const, gate.name))
+
+        for name, number in self.outputs.items():
+            circuit.Output(mapping[number], name)
+
+        return circuit
+
+    def Evaluate(self, inputs, workers: int=None, balance: bool=True, executor=None, cache=None):
+        """Evaluating circuit over input ciphertexts. Ready gates with the longest remaining chain are executed first.
+        Report with evaluated circuit, its multiplicative depth, critical path, number of gates and peak number
+        of live ciphertexts is saved in report attribute
+
+        :param inputs: input ciphertexts by input names
+        :type inputs: dict
+        :param workers: max number of concurrently executed gates. Number of CPUs if None
+        :type workers: int
+        :param balance: rebalance associative chains before evaluation
+        :type balance: bool
+        :param executor: executor for gates. Own thread pool is used if None
+        :type executor: concurrent.futures.Executor
+        :param cache: cache of decompositions for Mult gates. Useful, when one ciphertext is multiplied into many
+        :type cache: DecompositionCache
+        :return: output ciphertexts by output names
+        :rtype: dict
+        """
+
+        circuit = self.Balance() if balance else self.Pruned()
+
+        depth = circuit.Depth()
+        if depth > self.params.L:
+            raise ValueError(f"Multiplicative depth {depth} of circuit exceeds params.L = {self.params.L}")
+
+        gates = circuit.gates
+        consumers = circuit.Consumers()
+        outputs = set(circuit.outputs.values())
+
+        # Priority of gate is number of gates in the longest chain from it to some output
+        remaining = [0] * len(gates)
+        for number in reversed(range(len(gates))):
+            for input_number in gates[number].inputs:
+                remaining[input_number] = max(remaining[input_number], remaining[number] + 1)
+
+        waiting = [len(set(gate.inputs)) for gate in gates]
+        users = [[] for _ in gates]
+        for number, gate in enumerate(gates):
+            for input_number in set(gate.inputs):
+                users[input_number].append(number)
+
+        values = {}
+        peak_live = 0
+        ready = []
+
+        def finish(number, value):
+            nonlocal peak_live
+            values[number] = value
+            peak_live = max(peak_live, len(values))
+
+            for input_number in gates[number].inputs:
+                consumers[input_number] -= 1
+                if consumers[input_number] == 0 and input_number not in outputs:
+                    del values[input_number]
+
+            for user in users[number]:
+                waiting[user] -= 1
+                if waiting[user] == 0:
+                    heapq.heappush(ready, (-remaining[user], user))
+
+        limit = workers or os.cpu_count() or 1
+        own_executor = executor is None
+        executor = ThreadPoolExecutor(max_workers=limit) if own_executor else executor
+
+        try:
+            for number, gate in enumerate(gates):
+                if gate.op == "input":
+                    finish(number, inputs[gate.name])
+
+            running = {}
+            while ready or running:
+                while ready and len(running) < limit:
+                    _, number = heapq.heappop(ready)
+                    gate = gates[number]
+                    future = executor.submit(EvaluateGate, self.params, gate.op, gate.const,
+                                             [values[i] for i in gate.inputs], cache)
+                    running[future] = number
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finish(running.pop(future), future.result())
+        finally:
+            if own_executor:
+                executor.shutdown()
+
+        self.report = {
+            "circuit": circuit,
+            "depth": depth,
+            "gates": sum(1 for gate in gates if gate.op != "input"),
+            "critical_path": circuit.CriticalPath(),
+            "peak_live": peak_live,
+        }
+
+        return {name: values[number] for name, number in circuit.outputs.items()}
@@ -0,0 +1,453 @@
+from pyGSW.GSW import GSWCiphertext, HomomorphicOperations
+from pyGSW.utils import RandomUtils
+
+from concurrent.futures import ThreadPoolExecutor
+
+import json
+import math
+import os
+import shutil
+import tempfile
+import weakref
+import numpy as np
+
+
+# Number of messages, encrypted by one matrix production
+ENCRYPT_BATCH_SIZE = 4
+
+# Error bound and plaintext bound of every ciphertext in store. Unknown bound is nan
+BOUNDS_DTYPE = np.dtype([("noise", np.float64), ("message_bound", np.float64)])
+
+
+class EncryptedArray(object):
+    """Array of ciphertexts in chunked on-disk store. Chunks split array along axis 0 and every chunk
+    is kept in own .npy files with ciphertexts and their error and plaintext bounds. Every operation reads input chunks one by one
+    and writes result to new store, so only a few chunks are kept in memory. Operations without path write
+    result to temporary store, which is removed with its array object or on exit of with block
+
+    :arg path: directory of existing store
+    :type path: str
+    :return: None
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        with open(os.path.join(path, "meta.json")) as meta_file:
+            meta = json.load(meta_file)
+
+        self.shape = tuple(meta["shape"])
+        self.ciphertext_shape = tuple(meta["ciphertext_shape"])
+        self.chunk_size = meta["chunk_size"]
+
+        self.finalizer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.Delete()
+
+    def __str__(self) -> str:
+        return f"EncryptedArray(shape = {self.shape}, chunk_size = {self.chunk_size}, path = {self.path})"
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        return self.Slice(key)
+
+    @property
+    def chunks(self) -> int:
+        """Number of chunks"""
+
+        return math.ceil(self.shape[0] / self.chunk_size)
+
+    @staticmethod
+    def Create(path, shape, ciphertext_shape, chunk_size: int):
+        """Creating empty store for array of ciphertexts
+
+        :param path: directory of new store. Temporary directory if None
+        :type path: str
+        :param shape: array shape
+        :type shape: tuple
+        :param ciphertext_shape: shape of every ciphertext matrix
+        :type ciphertext_shape: tuple
+        :param chunk_size: number of array rows along axis 0 in one chunk
+        :type chunk_size: int
+        :return: array without chunks, which must be written with WriteChunk
+        :rtype: EncryptedArray
+        """
+
+        temporary = path is None
+        if temporary:
+            path = tempfile.mkdtemp(prefix="pyGSW_")
+        os.makedirs(path, exist_ok=True)
+
+        with open(os.path.join(path, "meta.json"), "w") as meta_file:
+            json.dump({"shape": list(shape), "ciphertext_shape": list(ciphertext_shape),
+                       "chunk_size": chunk_size}, meta_file)
+
+        array = EncryptedArray(path)
+        if temporary:
+            array.finalizer = weakref.finalize(array, shutil.rmtree, path, True)
+        return array
+
+    @staticmethod
+    def Encrypt(params, public_key, values, path=None, chunk_size: int=8, rng=None):
+        """Encrypting array of integer messages chunk by chunk
+
+        :param params: GSW scheme parameters
+        :type params: GSWParams
+        :param public_key: GSW public key
+        :type public_key: GSWPublicKey
+        :param values: array of integer messages. May be np.memmap
+        :type values: np.array
+        :param path: directory of new store. Temporary directory if None
+        :type path: str
+        :param chunk_size: number of array rows along axis 0 in one chunk
+        :type chunk_size: int
+        :param rng: random generator or seed
+        :type rng: np.random.Generator
+        :return: encrypted array
+        :rtype: EncryptedArray
+        """
+
+        rng = RandomUtils.Generator(rng)
+        array = EncryptedArray.Create(path, np.shape(values), (params.n, params.m), chunk_size)
+
+        for index in range(array.chunks):
+            messages = np.asarray(values[index*chunk_size:(index+1)*chunk_size])
+
+            cts = []
+            flat_messages = [int(message) for message in messages.ravel()]
+            for start in range(0, len(flat_messages), ENCRYPT_BATCH_SIZE):
+                cts += public_key.EncryptBatch(params, flat_messages[start:start+ENCRYPT_BATCH_SIZE], rng)
+
+            array.WriteChunk(index, np.reshape(cts, messages.shape + array.ciphertext_shape),
+                             np.reshape(np.array([EncryptedArray.Bounds(ct) for ct in cts], dtype=BOUNDS_DTYPE),
+                                        messages.shape))
+
+        return array
+
+    def ReadChunk(self, index: int):
+        """Reading chunk of ciphertexts as memory mapped matrix and its bounds
+
+        :param index: chunk number
+        :type index: int
+        :return: ciphertexts of shape (rows, ..., n, m) and bounds of BOUNDS_DTYPE of shape (rows, ...)
+        :rtype: tuple[np.array, np.array]
+        """
+
+        cts = np.load(os.path.join(self.path, f"chunk_{index:06d}.npy"), mmap_mode="r")
+        bounds = np.load(os.path.join(self.path, f"bounds_{index:06d}.npy"))
+        return cts, bounds
+
+    def WriteChunk(self, index: int, cts, bounds):
+        """Writing chunk of ciphertexts and its bounds
+
+        :param index: chunk number
+        :type index: int
+        :param cts: ciphertexts of shape (rows, ..., n, m)
+        :type cts: np.array
+        :param bounds: bounds of BOUNDS_DTYPE of shape (rows, ...)
+        :type bounds: np.array
+        :return: None
+        """
+
+        np.save(os.path.join(self.path, f"chunk_{index:06d}.npy"), np.asarray(cts, dtype=np.int64))
+        np.save(os.path.join(self.path, f"bounds_{index:06d}.npy"), np.asarray(bounds, dtype=BOUNDS_DTYPE))
+
+    def Delete(self):
+        """Removing store from disk
+
+        :return: None
+        """
+
+        if self.finalizer is not None:
+            self.finalizer.detach()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    @staticmethod
+    def Element(cts, bounds, index):
+        """Ciphertext of chunk with its error bound
+
+        :param cts: chunk ciphertexts
+        :type cts: np.array
+        :param bounds: chunk bounds
+        :type bounds: np.array
+        :param index: element index in chunk
+        :type index: tuple
+        :return: ciphertext with error bound
+        :rtype: GSWCiphertext
+        """
+
+        noise, message_bound = bounds[index]["noise"], bounds[index]["message_bound"]
+
+        return GSWCiphertext(np.array(cts[index]), None if np.isnan(noise) else float(noise),
+                             None if np.isnan(message_bound) else int(message_bound))
+
+    @staticmethod
+    def Bounds(ciphertext):
+        """Error bound and plaintext bound of ciphertext for store
+
+        :param ciphertext: ciphertext matrix
+        :type ciphertext: GSWCiphertext
+        :return: record of BOUNDS_DTYPE. Unknown bound is nan
+        :rtype: tuple
+        """
+
+        noise = getattr(ciphertext, "noise", None)
+        message_bound = getattr(ciphertext, "message_bound", None)
+        return (np.nan if noise is None else noise, np.nan if message_bound is None else message_bound)
+
+    def Map(self, operation, other=None, path=None):
+        """Applying operation to every ciphertext chunk by chunk
+
+        :param operation: function of ciphertext and other operand, returning GSWCiphertext
+        :type operation: function
+        :param other: other operand as array of equal shape and chunk size, plain integer array or integer
+        :type other: EncryptedArray or np.array or int
+        :param path: directory of result store. Temporary directory if None
+        :type path: str
+        :return: array of operation results
+        :rtype: EncryptedArray
+        """
+
+        if isinstance(other, EncryptedArray) and (other.shape != self.shape or other.chunk_size != self.chunk_size):
+            raise ValueError(f"Can not combine {self} and {other}")
+        if isinstance(other, np.ndarray) and other.shape != self.shape:
+            raise ValueError(f"Can not combine {self} and plain array of shape {other.shape}")
+
+        result = EncryptedArray.Create(path, self.shape, self.ciphertext_shape, self.chunk_size)
+
+        for chunk in range(self.chunks):
+            cts, bounds = self.ReadChunk(chunk)
+            if isinstance(other, EncryptedArray):
+                other_cts, other_bounds = other.ReadChunk(chunk)
+            elif isinstance(other, np.ndarray):
+                other_values = other[chunk*self.chunk_size:(chunk+1)*self.chunk_size]
+
+            result_cts = np.empty(cts.shape, dtype=np.int64)
+            result_bounds = np.empty(bounds.shape, dtype=BOUNDS_DTYPE)
+            for index in np.ndindex(bounds.shape):
+                if isinstance(other, EncryptedArray):
+                    operand = EncryptedArray.Element(other_cts, other_bounds, index)
+                elif isinstance(other, np.ndarray):
+                    operand = int(other_values[index])
+                else:
+                    operand = other
+
+                ct = operation(EncryptedArray.Element(cts, bounds, index), operand)
+                result_cts[index] = ct
+                result_bounds[index] = EncryptedArray.Bounds(ct)
+
+            result.WriteChunk(chunk, result_cts, result_bounds)
+
+        return result
+
+    def Add(self, params, other, path=None):
+        """Elementwise sum with other encrypted array or plain integer
+
+        :param params: GSW scheme parameters
+        :type params: GSWParams
+        :param other: encrypted array of equal shape and chunk size or plain integer
+        :type other: EncryptedArray or int
+        :param path: directory of result store. Temporary directory if None
+        :type path: str
+        :return: array of sums
+        :rtype: EncryptedArray
+        """
+
+        if isinstance(other, EncryptedArray):
+            return self.Map(lambda ct, other_ct: HomomorphicOperations.Add(params, ct, other_ct), other, path)
+        return self.Map(lambda ct, const: HomomorphicOperations.AddConst(params, ct, const), other, path)
+
+    def ConstMult(self, params, const, path=None):
+        """Elementwise multiplication by plain integer or plain integer array
+
+        :param params: GSW scheme parameters
+        :type params: GSWParams
+        :param const: plain integer or integer array of equal shape
+        :type const: int or np.array
+        :param path: directory of result store. Temporary directory if None
+        :type path: str
+        :return: array of productions
+        :rtype: EncryptedArray
+        """
+
+        return self.Map(lambda ct, const: HomomorphicOperations.ConstMult(params, ct, const), const, path)
+
+    def Mult(self, params, other, path=None, cache=None):
+        """Elementwise multiplication by other encrypted array or plain integer
+
+        :param params: GSW scheme parameters
+        :type params: GSWParams
+        :param other: encrypted array of equal shape and chunk size or plain integer
+        :type other: EncryptedArray or int
+        :param path: directory of result store. Temporary directory if None
+        :type path: str
+        :param cache: cache of decompositions of other ciphertexts
+        :type cache: DecompositionCache
+        :return: array of productions
+        :rtype: EncryptedArray
+        """
+
+        if isinstance(other, EncryptedArray):
+            return self.Map(lambda ct, other_ct: HomomorphicOperations.Mult(params, ct, other_ct, cache), other, path)
+        return self.ConstMult(params, other, path)
+
+    def Sum(self, params, axis=None, path=None):
+        """Sum of ciphertexts along axis
+
+        :param params: GSW scheme parameters
+        :type params: GSWParams
+        :param axis: summed axis. All ciphertexts are summed if None
+        :type axis: int
+        :param path: directory of result store. Temporary directory if None
+        :type path: str
+        :return: sum ciphertext if result is one ciphertext, else array of sums
+        :rtype: GSWCiphertext or EncryptedArray
+        """
+
+        def add(ct_1, ct_2):
+            return ct_2 if ct_1 is None else HomomorphicOperations.Add(params, ct_1, ct_2)
+
+        if axis is None or (axis in (0, -len(self.shape)) and len(self.shape) == 1):
+            total = None
+            for chunk in range(self.chunks):
+                cts, bounds = self.ReadChunk(chunk)
+                for index in np.ndindex(bounds.shape):
+                    total = add(total, EncryptedArray.Element(cts, bounds, index))
+            return total
+
+        axis = axis % len(self.shape)
+
+        if axis == 0:
+            # Every result chunk is summed over all input chunks, so only one chunk of sums is kept in memory
+            result = EncryptedArray.Create(path, self.shape[1:], self.ciphertext_shape, self.chunk_size)
+            for result_chunk in range(result.chunks):
+                columns = slice(result_chunk*self.chunk_size, (result_chunk+1)*self.chunk_size)
+
+                sums = {}
+                for chunk in range(self.chunks):
+                    cts, bounds = self.ReadChunk(chunk)
+                    cts, bounds = cts[:, columns], bounds[:, columns]
+                    for index in np.ndindex(bounds.shape):
+                        sums[index[1:]] = add(sums.get(index[1:]), EncryptedArray.Element(cts, bounds, index))
+
+                chunk_shape = (len(range(self.shape[1])[columns]),) + self.shape[2:]
+                result.WriteChunk(result_chunk, *EncryptedArray.Stack(sums, chunk_shape, self.ciphertext_shape))
+
+            return result
+
+        shape = self.shape[:axis] + self.shape[axis+1:]
+        result = EncryptedArray.Create(path, shape, self.ciphertext_shape, self.chunk_size)
+        for chunk in range(self.chunks):
+            cts, bounds = self.ReadChunk(chunk)
+
+            sums = {}
+            for index in np.ndindex(bounds.shape):
+                key = index[:axis] + index[axis+1:]
+                sums[key] = add(sums.get(key), EncryptedArray.Element(cts, bounds, index))
+
+            chunk_shape = bounds.shape[:axis] + bounds.shape[axis+1:]
+            result.WriteChunk(chunk, *EncryptedArray.Stack(sums, chunk_shape, self.ciphertext_shape))
+
+        return result
+
+    def Slice(self, key, path=None):
+        """Basic numpy indexing of array. Only selected rows of axis 0 are read
+
+        :param key: integer, slice or tuple of them
+        :type key: int or slice or tuple
+        :param path: directory of result store. Temporary directory if None
+        :type path: str
+        :return: ciphertext if key selects one element, else array of selected ciphertexts
+        :rtype: GSWCiphertext or EncryptedArray
+        """
+
+        key = key if isinstance(key, tuple) else (key,)
+        if not key:
+            key = (slice(None),)
+        head, rest = key[0], key[1:]
+
+        if isinstance(head, (int, np.integer)):
+            head = range(self.shape[0])[head]
+            cts, bounds = self.ReadChunk(head // self.chunk_size)
+            cts, bounds = cts[head % self.chunk_size][rest], bounds[head % self.chunk_size][rest]
+
+            if bounds.ndim == 0:
+                return EncryptedArray.Element(cts, bounds, ())
+
+            # Selected row is copied from memory mapped chunk by result chunks
+            result = EncryptedArray.Create(path, bounds.shape, self.ciphertext_shape, self.chunk_size)
+            for chunk in range(result.chunks):
+                rows = slice(chunk*self.chunk_size, (chunk+1)*self.chunk_size)
+                result.WriteChunk(chunk, cts[rows], bounds[rows])
+            return result
+
+        rows = range(self.shape[0])[head]
+        shape = (len(rows),) + np.broadcast_to(np.empty((), dtype=bool), self.shape[1:])[rest].shape
+        result = EncryptedArray.Create(path, shape, self.ciphertext_shape, self.chunk_size)
+
+        loaded = None
+        for chunk in range(result.chunks):
+            chunk_cts, chunk_bounds = [], []
+            for row in rows[chunk*self.chunk_size:(chunk+1)*self.chunk_size]:
+                if loaded != row // self.chunk_size:
+                    loaded = row // self.chunk_size
+                    cts, bounds = self.ReadChunk(loaded)
+                chunk_cts.append(cts[row % self.chunk_size][rest])
+                chunk_bounds.append(bounds[row % self.chunk_size][rest])
+
+            result.WriteChunk(chunk, chunk_cts, chunk_bounds)
+
+        return result
+
+    def Decrypt(self, params, secret_key, workers: int=None, strict: bool=False):
+        """Decrypting array with chunks decrypted in parallel
+
+        :param params: GSW scheme parameters
+        :type params: GSWParams
+        :param secret_key: GSW secret key
+        :type secret_key: GSWSecretKey
+        :param workers: number of threads. Default number of ThreadPoolExecutor if None
+        :type workers: int
+        :param strict: raise ValueError instead of warning if error bound of some ciphertext is too big
+        :type strict: bool
+        :return: array of decrypted values
+        :rtype: np.array
+        """
+
+        def decrypt(chunk):
+            cts, bounds = self.ReadChunk(chunk)
+            messages = secret_key.DecryptBatch(
+                params, [EncryptedArray.Element(cts, bounds, index) for index in np.ndindex(bounds.shape)], strict)
+            return np.reshape(np.asarray(messages, dtype=np.int64), bounds.shape)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            chunks = list(executor.map(decrypt, range(self.chunks)))
+
+        return np.concatenate(chunks) if chunks else np.empty(self.shape, dtype=np.int64)
+
+    @staticmethod
+    def Stack(ciphertexts, shape, ciphertext_shape):
+        """Stacking ciphertexts with their bounds into matrices
+
+        :param ciphertexts: ciphertexts by their indexes
+        :type ciphertexts: dict
+        :param shape: array shape
+        :type shape: tuple
+        :param ciphertext_shape: shape of every ciphertext matrix
+        :type ciphertext_shape: tuple
+        :return: ciphertexts of shape (shape, ciphertext_shape) and bounds of BOUNDS_DTYPE of shape shape
+        :rtype: tuple[np.array, np.array]
+        """
+
+        cts = np.empty(shape + ciphertext_shape, dtype=np.int64)
+        bounds = np.empty(shape, dtype=BOUNDS_DTYPE)
+        for index, ct in ciphertexts.items():
+            cts[index] = ct
+            bounds[index] = EncryptedArray.Bounds(ct)
+        return cts, bounds
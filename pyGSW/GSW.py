@@ -1,16 +1,23 @@
-from pyGSW.utils import Prime, MatrixUtils, status
+from pyGSW.utils import Prime, MatrixUtils, RandomUtils, status
 
 import math
+import warnings
 import numpy as np
 
 
 STANDARD_SECURITY_VALUE = 8
 
+# Error bounds are kept as this number of standard deviations of error distribution
+NOISE_DEVIATIONS = 6
+
+# Products of keys and ciphertexts sum n values below q^2, so parameters keep n*q^2 below this bound to be exact in int64
+MAX_KEY_PRODUCT = 2**63
+
 
 class GSWParams(object):
     """Contains GSW scheme parameters
 
-    :arg n: responsible for keys size as 2^Lambda
+    :arg n: responsible for keys size as 2^Lambda + r - 1
     :type n: int
     :arg q: responsible for security of scheme as a module of LWE ring
     :type q: int
@@ -24,10 +31,14 @@ class GSWParams(object):
     :type N: int
     :arg L: Deep of homomorphic operations
     :type L: int
+    :arg r: number of message slots in packed ciphertext. Last r rows of keys and ciphertexts carry slots
+    :type r: int
+    :arg max_message: max absolute value of plaintexts. Used for error growth estimation of multiplication
+    :type max_message: int
     :return: None
     """
 
-    def __init__(self, n: int, q: int, chi_scale, m: int, l: int, N: int, L: int):
+    def __init__(self, n: int, q: int, chi_scale, m: int, l: int, N: int, L: int, r: int=1, max_message: int=None):
         self.n = n
         self.q = q
         self.chi_scale = chi_scale  # q/8 relation???
@@ -35,28 +46,67 @@ class GSWParams(object):
         self.l = l
         self.N = N
         self.L = L
+        self.r = r
+        self.max_message = max_message if max_message is not None else q - 1
 
     def __str__(self) -> str:
-        return "n: {}, q: {}, chi_scale: {}, m: {}, l: {}, N: {}, L: {}".format(
-            self.n, self.q, self.chi_scale, self.m, self.l, self.N, self.L)
+        return "n: {}, q: {}, chi_scale: {}, m: {}, l: {}, N: {}, L: {}, r: {}, max_message: {}".format(
+            self.n, self.q, self.chi_scale, self.m, self.l, self.N, self.L, self.r, self.max_message)
 
     @staticmethod
-    def Setup(Lambda: int, L: int=10):
+    def Setup(Lambda: int, L: int=10, r: int=1, rng=None, max_message: int=1):
         """Generate and setup GSW scheme parameters
 
-        :param Lambda: GSW security parameter. Allows encrypt messages <= 2^(Lambda + 1)
+        :param Lambda: GSW security parameter. Allows encrypt and add messages <= 2^(Lambda + 1)
         :type Lambda: (int)
         :param L: Deep of homomorphic operations
         :type L: (int)
+        :param r: number of message slots in packed ciphertext. Use 1 for ordinary GSW scheme
+        :type r: (int)
+        :param rng: random generator or seed
+        :type rng: (np.random.Generator)
+        :param max_message: max absolute value of multiplied plaintexts, which q is chosen for. Default 1 is
+            enough for bit circuits. Error bound of multiplication of bigger plaintexts grows with their
+            plaintext bounds, so Decrypt warns about it
+        :type max_message: (int)
         :return: GSW scheme parameters for given security parameter Lambda.
         :rtype: (GSWParams)
         """
 
         status("Setup GSW parameters")
 
-        n = pow(2, Lambda)
+        # LWE secret keeps 2^Lambda - 1 random values, every slot adds one more row
+        n = pow(2, Lambda) + r - 1
+
+        # q has at least 2*Lambda bits and enough bits to decrypt production of two fresh ciphertexts
+        l = max(2*Lambda, max_message.bit_length() + 1)
+        while not GSWParams.Estimate(n, l, L, r, max_message).Fits(1, 1):
+            l += 1
+
+        if n * pow(2, 2*l) > MAX_KEY_PRODUCT:
+            raise ValueError(f"Lambda = {Lambda} requires q with {l} bits, so products of keys overflow int64")
+
+        q = Prime.generateSafePrime(l, rng)
+
+        return GSWParams.FromModulus(n, q, L, r, max_message)
 
-        q = Prime.generateSafePrime(2*Lambda)
+    @staticmethod
+    def FromModulus(n: int, q: int, L: int, r: int=1, max_message: int=None):
+        """Setup GSW scheme parameters with given key size and modulus
+
+        :param n: key size
+        :type n: (int)
+        :param q: module of LWE ring
+        :type q: (int)
+        :param L: Deep of homomorphic operations
+        :type L: (int)
+        :param r: number of message slots in packed ciphertext
+        :type r: (int)
+        :param max_message: max absolute value of plaintexts
+        :type max_message: (int)
+        :return: GSW scheme parameters
+        :rtype: (GSWParams)
+        """
 
         chi_scale = 1.0  # must be around 1.0
 
@@ -64,7 +114,238 @@ class GSWParams(object):
         l = math.ceil(math.log(q, 2))
         N = n * l
 
-        return GSWParams(n, q, chi_scale, m, l, N, L)
+        return GSWParams(n, q, chi_scale, m, l, N, L, r, max_message)
+
+    @staticmethod
+    def Estimate(n: int, l: int, L: int, r: int=1, max_message: int=None):
+        """Parameters with the smallest q of l bits. Any q of l bits gives the same m and l, but bigger budget,
+        so error growth is checked before generation of safe prime
+
+        :param n: key size
+        :type n: (int)
+        :param l: bit length of q
+        :type l: (int)
+        :return: GSW scheme parameters with q = 2^(l-1) + 1
+        :rtype: (GSWParams)
+        """
+
+        return GSWParams.FromModulus(n, pow(2, l-1) + 1, L, r, max_message)
+
+    @staticmethod
+    def ForWorkload(depth: int, fan_in: int, max_message: int, r: int=1, rng=None,
+                    Lambda: int=STANDARD_SECURITY_VALUE):
+        """Choose the smallest GSW parameters, which allow to decrypt result of given workload.
+        Workload is a circuit with depth levels of multiplications, where every multiplied ciphertext
+        is a sum of fan_in ciphertexts of previous level. Error grows with n, so n is the smallest one
+        for security parameter Lambda, and q is the smallest safe prime, which keeps error in budget.
+        Gadget base is always 2, so l is bit length of q
+
+        :param depth: number of multiplication levels
+        :type depth: (int)
+        :param fan_in: number of added ciphertexts on every level
+        :type fan_in: (int)
+        :param max_message: max absolute value of plaintexts in workload
+        :type max_message: (int)
+        :param r: number of message slots in packed ciphertext
+        :type r: (int)
+        :param rng: random generator or seed
+        :type rng: (np.random.Generator)
+        :param Lambda: GSW security parameter, n = 2^Lambda + r - 1
+        :type Lambda: (int)
+        :return: GSW scheme parameters with smallest q, that error stays in decryption budget
+        :rtype: (GSWParams)
+        """
+
+        n = pow(2, Lambda) + r - 1
+
+        # q must be bigger than any plaintext
+        l = max(3, max_message.bit_length() + 1)
+        while n * pow(2, 2*l) <= MAX_KEY_PRODUCT:
+            if GSWParams.Estimate(n, l, depth, r, max_message).Fits(depth, fan_in):
+                status("Setup GSW parameters for workload")
+
+                params = GSWParams.FromModulus(n, Prime.generateSafePrime(l, rng), depth, r, max_message)
+                if params.Fits(depth, fan_in):
+                    return params
+            l += 1
+
+        raise ValueError(f"No parameters with exact int64 key products for workload "
+                         f"depth = {depth}, fan_in = {fan_in}, max_message = {max_message}, Lambda = {Lambda}")
+
+    def Fits(self, depth: int, fan_in: int) -> bool:
+        """Check that result of workload may be decrypted, see ForWorkload
+
+        :param depth: number of multiplication levels
+        :type depth: int
+        :param fan_in: number of added ciphertexts on every level
+        :type fan_in: int
+        :return: workload error bound is in decryption budget and plaintexts are lower than q
+        :rtype: bool
+        """
+
+        return self.max_message < self.q and self.WorkloadNoise(depth, fan_in) < self.NoiseBudget()
+
+    def NoiseBudget(self) -> float:
+        """Max error bound of ciphertext, that still may be correctly decrypted
+
+        :return: decryption error budget q/4
+        :rtype: float
+        """
+
+        return self.q / 4
+
+    def FreshNoise(self) -> float:
+        """Error bound of fresh ciphertext. Error of ciphertext is e*R, where e values are rounded
+        normal values with chi_scale deviation and R is random {-1, 1} matrix m x m
+
+        :return: error bound of encryption result
+        :rtype: float
+        """
+
+        return NOISE_DEVIATIONS * math.sqrt(self.m * (self.chi_scale**2 + 1/12))
+
+    def AddNoise(self, noise_1, noise_2):
+        """Error bound of sum of two ciphertexts
+
+        :param noise_1: error bound of first ciphertext or None if it is unknown
+        :type noise_1: float
+        :param noise_2: error bound of second ciphertext or None if it is unknown
+        :type noise_2: float
+        :return: error bound of sum or None if it is unknown
+        :rtype: float
+        """
+
+        if noise_1 is None or noise_2 is None:
+            return None
+
+        return noise_1 + noise_2
+
+    def ConstMultNoise(self, noise, const):
+        """Error bound of ciphertext multiplied by constant
+
+        :param noise: error bound of ciphertext or None if it is unknown
+        :type noise: float
+        :param const: multiplied constant, may be zero or negative
+        :type const: int
+        :return: error bound of production or None if it is unknown
+        :rtype: float
+        """
+
+        if noise is None:
+            return None
+
+        # Error of (const mod q) * C is equal to error of c * C for centered residue c of const
+        return self.Centered(const) * noise
+
+    def MultNoise(self, noise_1, noise_2, message_1=None):
+        """Error bound of production C_1 * G^(-1)(C_2) of two ciphertexts, that is e_1 * G^(-1)(C_2) + mu_1 * e_2
+
+        :param noise_1: error bound of first ciphertext or None if it is unknown
+        :type noise_1: float
+        :param noise_2: error bound of second ciphertext or None if it is unknown
+        :type noise_2: float
+        :param message_1: bound of absolute plaintext value of first ciphertext. params.max_message if None
+        :type message_1: int
+        :return: error bound of production or None if it is unknown
+        :rtype: float
+        """
+
+        if noise_1 is None or noise_2 is None:
+            return None
+
+        if message_1 is None:
+            message_1 = self.max_message
+
+        # G^(-1)(C_2) is a random-like binary matrix, so every error value is a sum of about N/2
+        # independent centered values of e_1
+        return math.sqrt(self.N / 2) * noise_1 + message_1 * noise_2
+
+    def Centered(self, value: int) -> int:
+        """Absolute value of centered residue of integer modulo q
+
+        :param value: integer
+        :type value: int
+        :return: min(value mod q, q - value mod q)
+        :rtype: int
+        """
+
+        value = int(value) % self.q
+        return min(value, self.q - value)
+
+    def WorkloadNoise(self, depth: int, fan_in: int) -> float:
+        """Error bound of workload result, see ForWorkload
+
+        :param depth: number of multiplication levels
+        :type depth: int
+        :param fan_in: number of added ciphertexts on every level
+        :type fan_in: int
+        :return: error bound of workload result
+        :rtype: float
+        """
+
+        noise = self.ConstMultNoise(self.FreshNoise(), fan_in)
+        for _ in range(depth):
+            noise = self.ConstMultNoise(self.MultNoise(noise, noise), fan_in)
+
+        return noise
+
+    def CheckNoise(self, ciphertext, strict: bool=False):
+        """Check that error bound of ciphertext is in decryption budget and its plaintext bound is lower than q
+
+        :param ciphertext: checking ciphertext matrix. Plain matrices without bounds are not checked
+        :type ciphertext: GSWCiphertext
+        :param strict: raise ValueError instead of warning
+        :type strict: bool
+        :return: None
+        """
+
+        noise = getattr(ciphertext, "noise", None)
+        message_bound = getattr(ciphertext, "message_bound", None)
+
+        if noise is not None and noise >= self.NoiseBudget():
+            msg = f"Ciphertext error bound {noise:.0f} exceeds decryption budget {self.NoiseBudget():.0f}, " \
+                  f"decrypted value may be wrong"
+        elif message_bound is not None and message_bound >= self.q:
+            msg = f"Plaintext bound {message_bound} is not lower than q = {self.q}, " \
+                  f"decrypted value may be wrong"
+        else:
+            return
+
+        if strict:
+            raise ValueError(msg)
+        warnings.warn(msg, RuntimeWarning)
+
+
+class GSWCiphertext(np.ndarray):
+    """Ciphertext matrix, carrying analytic bound of its error and bound of its plaintext. Error of ciphertext C
+    encrypting mu is s*C - mu*s*G. Results of plain numpy operations do not carry bounds
+
+    :arg matrix: ciphertext matrix
+    :type matrix: np.array
+    :arg noise: bound of error values or None if it is unknown
+    :type noise: float
+    :arg message_bound: bound of absolute plaintext value or None if it is unknown
+    :type message_bound: int
+    :return: None
+    """
+
+    def __new__(cls, matrix, noise=None, message_bound=None):
+        ciphertext = np.asarray(matrix).view(cls)
+        ciphertext.noise = noise
+        ciphertext.message_bound = message_bound
+        return ciphertext
+
+    def __array_finalize__(self, obj):
+        self.noise = None
+        self.message_bound = None
+
+    def __reduce__(self):
+        reconstruct, args, state = super().__reduce__()
+        return reconstruct, args, (state, self.noise, self.message_bound)
+
+    def __setstate__(self, state):
+        state, self.noise, self.message_bound = state
+        super().__setstate__(state)
 
 
 class GSWSecretKey(object):
@@ -90,48 +371,97 @@ class GSWSecretKey(object):
                 \rv = {self.v}"
 
     @staticmethod
-    def SecretKeyGen(params):
+    def SecretKeyGen(params, rng=None):
         """Generating GSW secret key from input parameters
 
         :param params: GSW scheme parameters
         :type params: GSWParams
+        :param rng: random generator or seed
+        :type rng: np.random.Generator
         :return: GSW secret key of GSW parameters
         :rtype: GSWSecretKey
         """
 
         status("Generating GSW Secret key")
 
-        t = np.random.randint(0, params.q, params.n-1, dtype=np.int64)
+        rng = RandomUtils.Generator(rng)
+        t = rng.integers(0, params.q, params.n-1, dtype=np.int64)
         s = np.hstack((t, (np.array([1]))))
         v = MatrixUtils.Powerof2(params, s) % params.q
 
         return GSWSecretKey(s, t, v)
 
-    def Decrypt(self, params, ciphertext):
-        """Decrypting input ciphertext with bonded GSW secret key
+    def Decrypt(self, params, ciphertext, strict: bool=False):
+        """Decrypting input ciphertext with bonded GSW secret key. Warns if error bound of ciphertext is too big
 
         :param params: GSW scheme parameters
         :type params: GSWParams
         :param ciphertext:
         :type ciphertext: np.array
+        :param strict: raise ValueError instead of warning if error bound of ciphertext is too big
+        :type strict: bool
         :return: ciphertext decrypted value as best distance number
         :rtype: int
         """
 
         status("Decrypting message")
 
-        message = np.dot(self.SK, ciphertext) % params.q
+        params.CheckNoise(ciphertext, strict)
+
+        message = np.dot(self.SK, np.asarray(ciphertext)) % params.q
+
+        return self.Decode(params, message)
+
+    def DecryptBatch(self, params, ciphertexts, strict: bool=False):
+        """Decrypting list of ciphertexts with bonded GSW secret key by one matrix production
+
+        :param params: GSW scheme parameters
+        :type params: GSWParams
+        :param ciphertexts: list of ciphertext matrices
+        :type ciphertexts: list[np.array]
+        :param strict: raise ValueError instead of warning if error bound of some ciphertext is too big
+        :type strict: bool
+        :return: decrypted values of ciphertexts
+        :rtype: list[int]
+        """
+
+        status(f"Decrypting {len(ciphertexts)} messages")
+
+        if not ciphertexts:
+            return []
+
+        for ciphertext in ciphertexts:
+            params.CheckNoise(ciphertext, strict)
+
+        messages = MatrixUtils.ModDot(params, self.SK, np.hstack([np.asarray(ct) for ct in ciphertexts]))
+
+        return [self.Decode(params, message) for message in np.split(messages, len(ciphertexts))]
+
+    def Decode(self, params, message):
+        """Finding integer mu from vector s*C = mu*s*G + error
+
+        :param params: GSW scheme parameters
+        :type params: GSWParams
+        :param message: production of secret key and ciphertext modulo q
+        :type message: np.array
+        :return: decrypted value as best distance number
+        :rtype: int
+        """
 
         sg = MatrixUtils.Powerof2(params, self.SK) % params.q
 
-        div = np.rint((message / sg).astype(np.float)).astype(np.int64)
+        div = np.rint((message / sg).astype(np.float64)).astype(np.int64)
 
         modes = np.unique(div, return_counts=True)
 
         modes = sorted(zip(modes[0], modes[1]), key=lambda t: -t[1])
+
+        # Last block of s*G is (1, 2, ..., 2^(l-1)), so it always gives good candidate
+        candidates = [MatrixUtils.GadgetDecode(params, message[-params.l:])] + [mu for mu, _ in modes]
+
         best_number = 0
         best_dist = float('inf')
-        for mu, _ in modes:
+        for mu in candidates:
             dist = (message - mu*sg) % params.q
             dist = np.minimum(dist, params.q - dist)
 
@@ -163,21 +493,24 @@ class GSWPublicKey(object):
                 \re = {self.e}"
 
     @staticmethod
-    def PublicKeyGen(params, sk):
+    def PublicKeyGen(params, sk, rng=None):
         """Generating GSW public key from input parameters and secret key
 
         :param params: GSW scheme parameters
         :type params: GSWParams
         :param sk: GSW secret key of GSW parameters
         :type sk: np.array
+        :param rng: random generator or seed
+        :type rng: np.random.Generator
         :return: GSW public key of GSW parameters. Bonded with input secret key
         :rtype: GSWPublicKey
         """
 
         status("Generating GSW Public key")
 
-        B = np.random.randint(0, params.q, (params.n-1, params.m), dtype=np.int64)
-        e = np.rint(np.random.normal(scale=params.chi_scale, size=params.m)).astype(np.int)
+        rng = RandomUtils.Generator(rng)
+        B = rng.integers(0, params.q, (params.n-1, params.m), dtype=np.int64)
+        e = np.rint(rng.normal(scale=params.chi_scale, size=params.m)).astype(np.int64)
 
         b = np.add(np.dot(sk.t, B), e) % params.q
 
@@ -185,42 +518,234 @@ class GSWPublicKey(object):
 
         return GSWPublicKey(A, e)
 
-    def Encrypt(self, params, message):
+    def Encrypt(self, params, message, rng=None):
         """Encrypting input integer message with bonded GSW public key
 
         :param params: GSW scheme parameters
         :type params: GSWParams
         :param message: encrypting integer message. Must be <= 2*(Lambda+1)
         :type message: int
-        :return: ciphertext matrix
-        :rtype: np.array
+        :param rng: random generator or seed
+        :type rng: np.random.Generator
+        :return: ciphertext matrix with error bound
+        :rtype: GSWCiphertext
         """
 
         status("Encrypting message")
 
-        R = np.random.randint(2, size=(params.m, params.m), dtype=np.int64)
+        # Centered R keeps error e*R without common offset, which G^(-1) would accumulate in Mult
+        R = RandomUtils.RandomSigns(RandomUtils.Generator(rng), (params.m, params.m))
         G = MatrixUtils.buildGadget(params)
 
         C = (message*G + np.dot(self.PK, R)) % params.q
 
-        return C
+        return GSWCiphertext(C, params.FreshNoise(), abs(int(message)))
+
+    def EncryptBatch(self, params, messages, rng=None):
+        """Encrypting list of integer messages with bonded GSW public key by one matrix production
+
+        :param params: GSW scheme parameters
+        :type params: GSWParams
+        :param messages: encrypting integer messages. Every must be <= 2*(Lambda+1)
+        :type messages: list[int]
+        :param rng: random generator or seed
+        :type rng: np.random.Generator
+        :return: ciphertext matrices with error bounds
+        :rtype: list[GSWCiphertext]
+        """
+
+        status(f"Encrypting {len(messages)} messages")
+
+        if not messages:
+            return []
+
+        R = RandomUtils.RandomSigns(RandomUtils.Generator(rng), (params.m, params.m*len(messages)))
+        G = MatrixUtils.buildGadget(params)
+
+        AR = MatrixUtils.ModDot(params, self.PK, R)
+
+        return [GSWCiphertext((message*G + AR_i) % params.q, params.FreshNoise(), abs(int(message)))
+                for message, AR_i in zip(messages, np.hsplit(AR, len(messages)))]
 
 
 class GSWKeys(object):
     """Construction, containing GSW parameters and bonded secret and public keys of security parameter Lambda
 
     :arg Lambda: GSW security parameter. Allows encrypt messages <= 2^(Lambda + 1)
+    :arg rng: random generator or seed for parameters and keys generation
+    :return: None
+    """
+
+    def __init__(self, Lambda, rng=None):
+        rng = RandomUtils.Generator(rng)
+        self.params = GSWParams.Setup(Lambda, rng=rng)
+        self.secret_key = GSWSecretKey.SecretKeyGen(self.params, rng)
+        self.public_key = GSWPublicKey.PublicKeyGen(self.params, self.secret_key, rng)
+
+
+class GSWPackedSecretKey(object):
+    """Contains packed GSW Secret key for encryption of r messages into one ciphertext
+
+    :arg S: secret key matrix in the shape of (T | I_r)
+    :type S: np.array
+    :arg T: secret matrix r x (n-r) with random values from Z_q
+    :type T: np.array
+    :return: None
+    """
+
+    def __init__(self, S, T):
+        self.SK = S
+        self.T = T
+
+    def __str__(self) -> str:
+        return f"SK = {self.SK}\n \
+                \rT = {self.T}"
+
+    @staticmethod
+    def SecretKeyGen(params, rng=None):
+        """Generating packed GSW secret key from input parameters
+
+        :param params: GSW scheme parameters with r message slots
+        :type params: GSWParams
+        :param rng: random generator or seed
+        :type rng: np.random.Generator
+        :return: packed GSW secret key of GSW parameters
+        :rtype: GSWPackedSecretKey
+        """
+
+        status("Generating packed GSW Secret key")
+
+        rng = RandomUtils.Generator(rng)
+        T = rng.integers(0, params.q, (params.r, params.n-params.r), dtype=np.int64)
+        S = np.hstack((T, np.eye(params.r, dtype=np.int64)))
+
+        return GSWPackedSecretKey(S, T)
+
+    def Decrypt(self, params, ciphertext, strict: bool=False):
+        """Decrypting every slot of input packed ciphertext with bonded packed GSW secret key.
+        Warns if error bound of ciphertext is too big
+
+        :param params: GSW scheme parameters with r message slots
+        :type params: GSWParams
+        :param ciphertext: packed ciphertext matrix
+        :type ciphertext: np.array
+        :param strict: raise ValueError instead of warning if error bound of ciphertext is too big
+        :type strict: bool
+        :return: decrypted values of all r slots
+        :rtype: list[int]
+        """
+
+        status("Decrypting packed message")
+
+        params.CheckNoise(ciphertext, strict)
+
+        message = np.dot(self.SK, np.asarray(ciphertext)) % params.q  # r x N
+
+        messages = []
+        for i in range(params.r):
+            # Slot i is stored in gadget block of row n-r+i as (mu_i, mu_i*2, ..., mu_i*2^(l-1)) + small error
+            column = (params.n - params.r + i) * params.l
+            messages.append(MatrixUtils.GadgetDecode(params, message[i, column:column+params.l]))
+
+        return messages
+
+
+class GSWPackedPublicKey(object):
+    """Contains packed GSW Public key
+
+    :arg A: packed GSW public key as a big matrix in the shape of (-B | T*B + E)
+    :type A: np.array
+    :arg E: GSW error matrix r x m with small values
+    :type E: np.array
+    :return: None
+    """
+
+    def __init__(self, A, E):
+        self.PK = A
+        self.E = E
+
+    def __str__(self) -> str:
+        return f"PK = {self.PK}\n \
+                \rE = {self.E}"
+
+    @staticmethod
+    def PublicKeyGen(params, sk, rng=None):
+        """Generating packed GSW public key from input parameters and packed secret key
+
+        :param params: GSW scheme parameters with r message slots
+        :type params: GSWParams
+        :param sk: packed GSW secret key of GSW parameters
+        :type sk: GSWPackedSecretKey
+        :param rng: random generator or seed
+        :type rng: np.random.Generator
+        :return: packed GSW public key of GSW parameters. Bonded with input secret key
+        :rtype: GSWPackedPublicKey
+        """
+
+        status("Generating packed GSW Public key")
+
+        rng = RandomUtils.Generator(rng)
+        B = rng.integers(0, params.q, (params.n-params.r, params.m), dtype=np.int64)
+        E = np.rint(rng.normal(scale=params.chi_scale, size=(params.r, params.m))).astype(np.int64)
+
+        b = np.add(np.dot(sk.T, B), E) % params.q
+
+        A = np.vstack((-B, b)) % params.q  # B = (n-r) x m; b = r x m; A = n x m
+
+        return GSWPackedPublicKey(A, E)
+
+    def Encrypt(self, params, messages, rng=None):
+        """Encrypting up to r integer messages into one ciphertext with bonded packed GSW public key
+
+        :param params: GSW scheme parameters with r message slots
+        :type params: GSWParams
+        :param messages: encrypting integer messages. Missing slots are filled with zeros
+        :type messages: list[int]
+        :param rng: random generator or seed
+        :type rng: np.random.Generator
+        :return: packed ciphertext matrix with error bound
+        :rtype: GSWCiphertext
+        """
+
+        status("Encrypting packed message")
+
+        if len(messages) > params.r:
+            raise ValueError(f"Can not pack {len(messages)} messages into {params.r} slots")
+
+        slots = np.zeros(params.n, dtype=np.int64)
+        slots[params.n-params.r:params.n-params.r+len(messages)] = messages
+
+        # Centered R keeps error e*R without common offset, which G^(-1) would accumulate in Mult
+        R = RandomUtils.RandomSigns(RandomUtils.Generator(rng), (params.m, params.m))
+        G = MatrixUtils.buildGadget(params)
+
+        C = (slots[:, np.newaxis]*G + np.dot(self.PK, R)) % params.q
+
+        return GSWCiphertext(C, params.FreshNoise(), int(np.abs(slots).max()))
+
+
+class GSWPackedKeys(object):
+    """Construction, containing packed GSW parameters and bonded secret and public keys of security parameter Lambda
+
+    :arg Lambda: GSW security parameter. Allows encrypt messages <= 2^(Lambda + 1)
+    :arg r: number of message slots in one ciphertext
+    :arg rng: random generator or seed for parameters and keys generation
     :return: None
     """
 
-    def __init__(self, Lambda):
-        self.params = GSWParams.Setup(Lambda)
-        self.secret_key = GSWSecretKey.SecretKeyGen(self.params)
-        self.public_key = GSWPublicKey.PublicKeyGen(self.params, self.secret_key)
+    def __init__(self, Lambda, r, rng=None):
+        rng = RandomUtils.Generator(rng)
+        self.params = GSWParams.Setup(Lambda, r=r, rng=rng)
+        self.secret_key = GSWPackedSecretKey.SecretKeyGen(self.params, rng)
+        self.public_key = GSWPackedPublicKey.PublicKeyGen(self.params, self.secret_key, rng)
 
 
 class HomomorphicOperations(object):
-    """Contain follow homomorphic operations over ciphertext matrices: Add, Constant Multiplication"""
+    """Contain follow homomorphic operations over ciphertext matrices: Add, Constant Multiplication, Multiplication
+
+    Add and Constant Multiplication work slot-wise for packed ciphertexts.
+    Every operation updates error bound and plaintext bound of result ciphertext
+    """
 
     @staticmethod
     def Add(params, ciphertext_1, ciphertext_2):
@@ -233,12 +758,38 @@ class HomomorphicOperations(object):
         :param ciphertext_2: second ciphertext
         :type ciphertext_2: np.array
         :return: Sum of two input ciphertexts matrix
-        :rtype: np.array
+        :rtype: GSWCiphertext
         """
 
-        ct1_plus_ct2 = (ciphertext_1 + ciphertext_2) % params.q
+        ct1_plus_ct2 = (np.asarray(ciphertext_1) + np.asarray(ciphertext_2)) % params.q
 
-        return ct1_plus_ct2
+        noise = params.AddNoise(getattr(ciphertext_1, "noise", None), getattr(ciphertext_2, "noise", None))
+        message_bounds = (getattr(ciphertext_1, "message_bound", None), getattr(ciphertext_2, "message_bound", None))
+        message_bound = None if None in message_bounds else sum(message_bounds)
+
+        return GSWCiphertext(ct1_plus_ct2, noise, message_bound)
+
+    @staticmethod
+    def AddConst(params, ciphertext, const):
+        """Sum of ciphertext and plain integer constant. Constant is added as noiseless encryption const*G
+
+        :param params: GSW scheme parameters
+        :type params: GSWParams
+        :param ciphertext: ciphertext matrix
+        :type ciphertext: np.array
+        :param const: added constant
+        :type const: int
+        :return: new ciphertext as (ciphertext + const)
+        :rtype: GSWCiphertext
+        """
+
+        ct_plus_const = (np.asarray(ciphertext) + const*MatrixUtils.buildGadget(params)) % params.q
+
+        message_bound = getattr(ciphertext, "message_bound", None)
+        if message_bound is not None:
+            message_bound += params.Centered(const)
+
+        return GSWCiphertext(ct_plus_const, getattr(ciphertext, "noise", None), message_bound)
 
     @staticmethod
     def ConstMult(params, ciphertext, const):
@@ -248,21 +799,26 @@ class HomomorphicOperations(object):
         :type params: GSWParams
         :param ciphertext: multiplied ciphertext matrix
         :type ciphertext: np.array
-        :param const: multiplied constant
+        :param const: multiplied constant. Result encrypts const*mu modulo q, e.g. q - mu for const = -1
         :type const: int
         :return: new ciphertext as (const x ciphertext)
-        :rtype: np.array
+        :rtype: GSWCiphertext
         """
 
-        ct_x_const = np.copy(ciphertext)
-        for _ in range(const - 1):
-            ct_x_const = (ct_x_const + ciphertext) % params.q
+        # Zero and negative constants are multiplied as their residues modulo q
+        ct_x_const = (np.asarray(ciphertext) * (const % params.q)) % params.q
 
-        return ct_x_const
+        noise = params.ConstMultNoise(getattr(ciphertext, "noise", None), const)
+        message_bound = getattr(ciphertext, "message_bound", None)
+        if message_bound is not None:
+            message_bound *= params.Centered(const)
+
+        return GSWCiphertext(ct_x_const, noise, message_bound)
 
     @staticmethod
-    def Mult(params, ciphertext_1, ciphertext_2):  # DO NOT WORK AT ALL! :(
-        """Should multiply two input ciphertext, but...
+    def Mult(params, ciphertext_1, ciphertext_2, cache=None):
+        """Multiply two input ciphertext as C_1 * G^(-1)(C_2). Error grows about sqrt(N) times,
+        so only small messages may be multiplied. Does not work slot-wise for packed ciphertexts
 
         :param params: GSW scheme parameters
         :type params: GSWParams
@@ -270,13 +826,24 @@ class HomomorphicOperations(object):
         :type ciphertext_1: np.array
         :param ciphertext_2: second ciphertext matrix
         :type ciphertext_2: np.array
+        :param cache: cache of decompositions G^(-1)(C_2) for ciphertext_2, used in many productions
+        :type cache: DecompositionCache
         :return: production of two input ciphertext matrix
-        :rtype: np.array
+        :rtype: GSWCiphertext
         """
 
-        gadget = MatrixUtils.buildGadget(params)
-        matrix = MatrixUtils.BitDecompMatrix(params, ciphertext_2.T)
+        # Column j of G^(-1)(C_2) is bit decomposition of column j of C_2
+        if cache is not None:
+            matrix = cache.Decompose(params, ciphertext_2)
+        else:
+            matrix = MatrixUtils.GadgetDecompose(params, ciphertext_2)
+
+        ca_x_cb = MatrixUtils.ModDot(params, np.asarray(ciphertext_1), matrix)
 
-        ca_x_cb = np.dot(ciphertext_1, matrix) % params.q
+        # Error term mu_1 * e_2 is bounded by plaintext bound of the first ciphertext, if it is known
+        message_bounds = (getattr(ciphertext_1, "message_bound", None), getattr(ciphertext_2, "message_bound", None))
+        noise = params.MultNoise(getattr(ciphertext_1, "noise", None), getattr(ciphertext_2, "noise", None),
+                                 message_bounds[0])
+        message_bound = None if None in message_bounds else message_bounds[0] * message_bounds[1]
 
-        return ca_x_cb
+        return GSWCiphertext(ca_x_cb, noise, message_bound)
@@ -1,3 +1,7 @@
-from pyGSW.GSW import GSWParams, GSWPublicKey, GSWSecretKey, GSWKeys
+from pyGSW.GSW import GSWParams, GSWPublicKey, GSWSecretKey, GSWKeys, GSWCiphertext
+from pyGSW.GSW import GSWPackedPublicKey, GSWPackedSecretKey, GSWPackedKeys
 from pyGSW.GSW import HomomorphicOperations
 from pyGSW.utils import *
+from pyGSW.AsyncGSW import AsyncGSW
+from pyGSW.EncryptedArray import EncryptedArray
+from pyGSW.Circuit import Circuit
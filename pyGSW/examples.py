@@ -1,4 +1,4 @@
-from pyGSW.GSW import GSWKeys
+from pyGSW.GSW import GSWParams, GSWKeys, GSWPackedKeys
 from pyGSW.GSW import HomomorphicOperations
 
 from random import randint
@@ -64,7 +64,46 @@ def simple_homomorphic_operations():
 
     # Other homomorphic operations execute similarly
 
+    # Every ciphertext carries error bound, which grows with homomorphic operations.
+    # Decryption warns, if error bound exceeds params.NoiseBudget()
+    print(f"Error bound of sum: {ct_add.noise}, decryption budget: {keys.params.NoiseBudget()}")
+
+
+def parameters_for_workload():
+    """Parameters selection example"""
+
+    # Choosing the smallest parameters with standard security for two levels of multiplications
+    # of sums of 2 ciphertexts, where every plaintext and sum is 0 or 1
+    params = GSWParams.ForWorkload(depth=2, fan_in=2, max_message=1)
+    print(f"Parameters for workload: \n{params}")
+    print(f"Error bound of result: {params.WorkloadNoise(2, 2)}, decryption budget: {params.NoiseBudget()}")
+
+
+def packed_encryption_decryption():
+    """Packed encryption of several messages into one ciphertext example"""
+
+    # To encrypt several messages at once need import GSWPackedKeys Class
+    # Generating GSW parameters with 4 message slots, packed public key and secret key keypair
+    keys = GSWPackedKeys(LAMBDA_VALUE, 4)
+
+    messages_a = [randint(1, keys.params.n) for _ in range(4)]
+    messages_b = [randint(1, keys.params.n) for _ in range(4)]
+    print(f"Slot-wise sum of plain messages: {[a + b for a, b in zip(messages_a, messages_b)]}")
+
+    # Every ciphertext contains all 4 messages
+    ct_a = keys.public_key.Encrypt(keys.params, messages_a)
+    ct_b = keys.public_key.Encrypt(keys.params, messages_b)
+
+    # Homomorphic operations over packed ciphertexts are performed slot by slot
+    ct_add = HomomorphicOperations.Add(keys.params, ct_a, ct_b)
+
+    # Decrypting returns values of all slots
+    ct_add_dec = keys.secret_key.Decrypt(keys.params, ct_add)
+    print(f"Decrypted slot-wise sum of encrypted messages: {ct_add_dec}")
+
 
 if __name__ == "__main__":
     simple_encryption_decryption()
     simple_homomorphic_operations()
+    parameters_for_workload()
+    packed_encryption_decryption()
@@ -1,11 +1,22 @@
-from pyGSW.utils import MatrixUtils
-from pyGSW.GSW import GSWParams, GSWPublicKey, GSWSecretKey, GSWKeys
+from pyGSW.utils import MatrixUtils, RandomUtils, DecompositionCache
+from pyGSW.GSW import GSWParams, GSWPublicKey, GSWSecretKey, GSWKeys, GSWCiphertext, STANDARD_SECURITY_VALUE
+from pyGSW.GSW import GSWPackedPublicKey, GSWPackedSecretKey
 from pyGSW.GSW import HomomorphicOperations
-
+from pyGSW.AsyncGSW import AsyncGSW
+from pyGSW.EncryptedArray import EncryptedArray
+from pyGSW.Circuit import Circuit
+
+import asyncio
+import gc
+import os
+import tempfile
+import threading
+import time
 import numpy as np
 
 from random import randint
-from unittest import main, TestCase
+from types import SimpleNamespace
+from unittest import main, mock, skipIf, TestCase
 
 LAMBDA_VALUE = 7  # values 7(3-4 sec per encrypt operation), 8(50-54 sec per encrypt operation) is OK
 
@@ -58,6 +69,43 @@ class KeyGenTest(TestCase):
         self.assertTrue(np.all(check == (pk.e % params.q)))
 
 
+class RandomTest(TestCase):
+
+    def test_seed_reproducibility(self):
+        # Equal seeds give equal parameters, keys and ciphertexts
+        keys_a = GSWKeys(LAMBDA_VALUE, rng=42)
+        keys_b = GSWKeys(LAMBDA_VALUE, rng=42)
+
+        self.assertEqual(keys_a.params.q, keys_b.params.q)
+        self.assertTrue(np.array_equal(keys_a.secret_key.SK, keys_b.secret_key.SK))
+        self.assertTrue(np.array_equal(keys_a.public_key.PK, keys_b.public_key.PK))
+
+        ct_a = keys_a.public_key.EncryptBatch(keys_a.params, [1, 2], rng=7)
+        ct_b = keys_b.public_key.EncryptBatch(keys_b.params, [1, 2], rng=7)
+
+        self.assertTrue(all(np.array_equal(a, b) for a, b in zip(ct_a, ct_b)))
+
+    def test_Spawn(self):
+        # Spawned generators are reproducible and independent from each other
+        rngs_a = RandomUtils.Spawn(42, 3)
+        rngs_b = RandomUtils.Spawn(42, 3)
+
+        values_a = [rng.integers(0, 2**32, 8) for rng in rngs_a]
+        values_b = [rng.integers(0, 2**32, 8) for rng in rngs_b]
+
+        self.assertTrue(all(np.array_equal(a, b) for a, b in zip(values_a, values_b)))
+        self.assertFalse(np.array_equal(values_a[0], values_a[1]))
+        self.assertEqual(len(RandomUtils.Spawn(RandomUtils.Generator(42), 3)), 3)
+
+    def test_RandomBits(self):
+        bits = RandomUtils.RandomBits(RandomUtils.Generator(42), (100, 37))
+        signs = RandomUtils.RandomSigns(RandomUtils.Generator(42), (100, 37))
+
+        self.assertEqual(bits.shape, (100, 37))
+        self.assertTrue(set(np.unique(bits)) == {0, 1})
+        self.assertTrue(np.array_equal(signs, 2 * bits.astype(np.int8) - 1))
+
+
 class FlattenFuncsTest(TestCase):
 
     def test_BD_Pof2(self):
@@ -118,6 +166,71 @@ class EncryptionDecryptionTest(TestCase):
         # Compare messages and decrypted ones
         self.assertTrue(messages == decrypted_messages)
 
+    def test_Batch_Encryption_and_Decryption(self):
+        params = GSWParams.Setup(LAMBDA_VALUE)
+
+        sk = GSWSecretKey.SecretKeyGen(params)
+        pk = GSWPublicKey.PublicKeyGen(params, sk)
+
+        messages = [randint(0, params.n * 2) for none in range(5)]
+
+        # Batch ciphertexts are usual ciphertexts
+        cts = pk.EncryptBatch(params, messages)
+
+        self.assertEqual([sk.Decrypt(params, ct) for ct in cts], messages)
+        self.assertEqual(sk.DecryptBatch(params, cts), messages)
+
+
+class AsyncGSWTest(TestCase):
+
+    def test_encrypt_decrypt(self):
+        keys = GSWKeys(LAMBDA_VALUE)
+        messages = [randint(0, keys.params.n * 2) for none in range(4)]
+
+        async def run():
+            async with AsyncGSW(keys, max_batch_size=4, max_wait=1.0) as service:
+                # Concurrent requests are collected into one batch
+                cts = await asyncio.gather(*[service.encrypt(message) for message in messages])
+                decrypted_messages = await asyncio.gather(*[service.decrypt(ct) for ct in cts])
+
+                return decrypted_messages, service.stats(), service.queue_depth
+
+        decrypted_messages, stats, queue_depth = asyncio.run(run())
+
+        self.assertEqual(decrypted_messages, messages)
+        self.assertEqual(stats["encrypt"]["batches"], 1)
+        self.assertEqual(stats["decrypt"]["max_batch_size"], len(messages))
+        self.assertEqual(queue_depth, 0)
+
+
+    def test_close_running_batch(self):
+        started, release = threading.Event(), threading.Event()
+
+        class SlowPublicKey(object):
+            def EncryptBatch(self, params, messages, rng):
+                started.set()
+                release.wait(5)
+                return messages
+
+        keys = SimpleNamespace(params=None, public_key=SlowPublicKey(), secret_key=None)
+
+        async def run():
+            service = AsyncGSW(keys, max_batch_size=1, max_wait=0)
+            request = asyncio.ensure_future(service.encrypt(1))
+
+            # Request of running batch is cancelled by close
+            await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+            await service.close()
+            release.set()
+
+            with self.assertRaises(asyncio.CancelledError):
+                await asyncio.wait_for(request, 2)
+
+            # Closed service does not accept new requests
+            with self.assertRaises(RuntimeError):
+                await service.encrypt(1)
+
+        asyncio.run(run())
 
 class HomomorphicOperationTest(TestCase):
 
@@ -183,5 +296,487 @@ class HomomorphicOperationTest(TestCase):
         self.assertTrue(all(test_results))
 
 
+class NoiseTrackingTest(TestCase):
+
+    def setUp(self):
+        self.params = GSWParams.Setup(LAMBDA_VALUE)
+
+        self.sk = GSWSecretKey.SecretKeyGen(self.params)
+        self.pk = GSWPublicKey.PublicKeyGen(self.params, self.sk)
+
+    def error(self, ciphertext, message):
+        # Real error of ciphertext is s*C - mu*s*G
+        error = (np.dot(self.sk.SK, ciphertext) - message * MatrixUtils.Powerof2(self.params, self.sk.SK)) % self.params.q
+        return np.max(np.minimum(error, self.params.q - error))
+
+    def test_Add_and_ConstMult_bounds(self):
+        const = 3
+        message_a = randint(1, self.params.n // const)
+        message_b = randint(1, self.params.n // const)
+
+        ct_a = self.pk.Encrypt(self.params, message_a)
+        ct_b = self.pk.Encrypt(self.params, message_b)
+
+        ct_add = HomomorphicOperations.Add(self.params, ct_a, ct_b)
+        ct_constmult = HomomorphicOperations.ConstMult(self.params, ct_add, const)
+
+        # Fresh error bound is fixed by parameters and grows with every operation
+        self.assertEqual(ct_a.noise, self.params.FreshNoise())
+        self.assertEqual(ct_add.noise, 2 * self.params.FreshNoise())
+        self.assertEqual(ct_constmult.noise, 2 * const * self.params.FreshNoise())
+
+        # Real errors must be lower than their bounds
+        self.assertLess(self.error(ct_a, message_a), ct_a.noise)
+        self.assertLess(self.error(ct_add, message_a + message_b), ct_add.noise)
+        self.assertLess(self.error(ct_constmult, (message_a + message_b) * const), ct_constmult.noise)
+
+        self.assertEqual(self.sk.Decrypt(self.params, ct_constmult, strict=True), (message_a + message_b) * const)
+
+    def test_ConstMult_zero_and_negative(self):
+        message = randint(1, self.params.n)
+        ct = self.pk.Encrypt(self.params, message)
+
+        ct_zero = HomomorphicOperations.ConstMult(self.params, ct, 0)
+        ct_negative = HomomorphicOperations.ConstMult(self.params, ct, -2)
+
+        # Multiplication by zero removes error, negative constant keeps error of its absolute value
+        self.assertEqual(ct_zero.noise, 0)
+        self.assertEqual(ct_negative.noise, 2 * ct.noise)
+        self.assertLess(self.error(ct_negative, -2 * message), ct_negative.noise)
+
+        self.assertEqual(self.sk.Decrypt(self.params, ct_zero, strict=True), 0)
+        self.assertEqual(self.sk.Decrypt(self.params, ct_negative, strict=True), self.params.q - 2 * message)
+
+    def test_Mult(self):
+        # Default parameters allow one multiplication of bits
+        message_a = randint(0, 1)
+        message_b = randint(0, 1)
+
+        ct_a = self.pk.Encrypt(self.params, message_a)
+        ct_b = self.pk.Encrypt(self.params, message_b)
+
+        ct_mult = HomomorphicOperations.Mult(self.params, ct_a, ct_b)
+
+        self.assertEqual(ct_mult.noise, self.params.MultNoise(ct_a.noise, ct_b.noise, message_a))
+        self.assertLess(self.error(ct_mult, message_a * message_b), ct_mult.noise)
+        self.assertEqual(self.sk.Decrypt(self.params, ct_mult, strict=True), message_a * message_b)
+
+        # Second level of multiplications exceeds decryption budget
+        ct_mult_2 = HomomorphicOperations.Mult(self.params, ct_mult, ct_b)
+
+        with self.assertWarns(RuntimeWarning):
+            self.sk.Decrypt(self.params, ct_mult_2)
+
+        with self.assertRaises(ValueError):
+            self.sk.Decrypt(self.params, ct_mult_2, strict=True)
+
+    def test_Mult_out_of_range(self):
+        keys = GSWKeys(5)
+
+        # Plaintext bounds are carried by ciphertexts and grow with operations
+        ct_a = keys.public_key.Encrypt(keys.params, 1000)
+        ct_b = keys.public_key.Encrypt(keys.params, 5)
+        self.assertEqual(HomomorphicOperations.Add(keys.params, ct_a, ct_b).message_bound, 1005)
+        self.assertEqual(HomomorphicOperations.ConstMult(keys.params, ct_a, -2).message_bound, 2000)
+
+        # Error of multiplication of plaintexts bigger than params.max_message is not hidden
+        ct_mult = HomomorphicOperations.Mult(keys.params, ct_a, ct_b)
+        self.assertEqual(ct_mult.message_bound, 5000)
+
+        with self.assertWarns(RuntimeWarning):
+            keys.secret_key.Decrypt(keys.params, ct_mult)
+
+        with self.assertRaises(ValueError):
+            keys.secret_key.Decrypt(keys.params, ct_mult, strict=True)
+
+    def test_Mult_max_message(self):
+        MAX_MESSAGE_VALUE = 4
+
+        # q is chosen to decrypt one multiplication of plaintexts <= max_message
+        params = GSWParams.Setup(LAMBDA_VALUE, max_message=MAX_MESSAGE_VALUE)
+        self.assertTrue(params.Fits(1, 1))
+
+        sk = GSWSecretKey.SecretKeyGen(params)
+        pk = GSWPublicKey.PublicKeyGen(params, sk)
+
+        message_a = randint(0, MAX_MESSAGE_VALUE)
+        message_b = randint(0, MAX_MESSAGE_VALUE)
+
+        ct_mult = HomomorphicOperations.Mult(params, pk.Encrypt(params, message_a), pk.Encrypt(params, message_b))
+
+        self.assertEqual(sk.Decrypt(params, ct_mult, strict=True), message_a * message_b)
+
+    def test_ForWorkload(self):
+        fan_in = 4
+        max_message = 100
+
+        # Small insecure key keeps encryption in test fast
+        params = GSWParams.ForWorkload(0, fan_in, max_message, Lambda=2)
+
+        self.assertLess(params.WorkloadNoise(0, fan_in), params.NoiseBudget())
+        self.assertEqual(params.max_message, max_message)
+        self.assertEqual(params.L, 0)
+
+        sk = GSWSecretKey.SecretKeyGen(params)
+        pk = GSWPublicKey.PublicKeyGen(params, sk)
+
+        # Sum of fan_in ciphertexts must be decrypted without warnings
+        messages = [randint(0, max_message // fan_in) for none in range(fan_in)]
+        ct_sum = pk.Encrypt(params, messages[0])
+        for message in messages[1:]:
+            ct_sum = HomomorphicOperations.Add(params, ct_sum, pk.Encrypt(params, message))
+
+        self.assertEqual(sk.Decrypt(params, ct_sum, strict=True), sum(messages))
+
+    def test_ForWorkload_depth(self):
+        depth = 2
+        fan_in = 2
+
+        # Selected q keeps key products exact in int64
+        params = GSWParams.ForWorkload(depth, fan_in, 1, Lambda=2)
+
+        self.assertTrue(params.Fits(depth, fan_in))
+        self.assertLess(params.n * params.q ** 2, 2 ** 63)
+
+        sk = GSWSecretKey.SecretKeyGen(params)
+        pk = GSWPublicKey.PublicKeyGen(params, sk)
+
+        # Every level multiplies sums of fan_in ciphertexts, sums of bits are kept <= 1
+        ct_zero = pk.Encrypt(params, 0)
+        ct = HomomorphicOperations.Add(params, pk.Encrypt(params, 1), ct_zero)
+        for _ in range(depth):
+            ct = HomomorphicOperations.Add(params, HomomorphicOperations.Mult(params, ct, ct), ct_zero)
+
+        self.assertLessEqual(ct.noise, params.WorkloadNoise(depth, fan_in))
+        self.assertEqual(sk.Decrypt(params, ct, strict=True), 1)
+
+    def test_ForWorkload_security(self):
+        # Key size is never below standard security value
+        self.assertEqual(GSWParams.ForWorkload(0, 1, 1).n, pow(2, STANDARD_SECURITY_VALUE))
+
+        params = GSWParams.ForWorkload(1, 2, 1, Lambda=8)
+
+        self.assertEqual(params.n, pow(2, 8))
+        self.assertTrue(params.Fits(1, 2))
+        self.assertGreaterEqual(params.m, GSWParams.Setup(8).m)
+
+    def test_Setup_overflow(self):
+        # Products of keys with such q overflow int64
+        with self.assertRaises(ValueError):
+            GSWParams.Setup(13)
+
+
+class PackedEncryptionTest(TestCase):
+
+    SLOTS = 4
+
+    def setUp(self):
+        self.params = GSWParams.Setup(LAMBDA_VALUE, r=self.SLOTS)
+
+        self.sk = GSWPackedSecretKey.SecretKeyGen(self.params)
+        self.pk = GSWPackedPublicKey.PublicKeyGen(self.params, self.sk)
+
+    def test_pk_sk_relation(self):
+        # Matrix production of secret key matrix and public key matrix must be equal to error matrix
+        check = np.dot(self.sk.SK, self.pk.PK) % self.params.q
+
+        self.assertTrue(np.all(check == (self.pk.E % self.params.q)))
+
+    def test_Encryption_and_Decryption(self):
+        messages = [randint(0, self.params.q - 1) for none in range(self.SLOTS)]
+
+        ct = self.pk.Encrypt(self.params, messages)
+
+        self.assertEqual(self.sk.Decrypt(self.params, ct), messages)
+
+        # Not used slots are decrypted as zeros
+        ct = self.pk.Encrypt(self.params, messages[:1])
+
+        self.assertEqual(self.sk.Decrypt(self.params, ct), messages[:1] + [0] * (self.SLOTS - 1))
+
+    def test_Add_and_ConstMult(self):
+        MAX_CONST_VALUE = 10
+
+        messages_a = [randint(1, self.params.n) for none in range(self.SLOTS)]
+        messages_b = [randint(1, self.params.n) for none in range(self.SLOTS)]
+        const = randint(1, MAX_CONST_VALUE)
+
+        ct_a = self.pk.Encrypt(self.params, messages_a)
+        ct_b = self.pk.Encrypt(self.params, messages_b)
+
+        # Homomorphic operations over packed ciphertexts work slot by slot
+        ct_add = HomomorphicOperations.Add(self.params, ct_a, ct_b)
+        ct_constmult = HomomorphicOperations.ConstMult(self.params, ct_a, const)
+
+        self.assertEqual(self.sk.Decrypt(self.params, ct_add), [a + b for a, b in zip(messages_a, messages_b)])
+        self.assertEqual(self.sk.Decrypt(self.params, ct_constmult), [a * const for a in messages_a])
+
+
+class EncryptedArrayTest(TestCase):
+
+    def setUp(self):
+        self.keys = GSWKeys(LAMBDA_VALUE)
+        self.params = self.keys.params
+
+        self.directory = tempfile.TemporaryDirectory()
+
+        # Array with 3 chunks, last one is not full
+        self.values = np.random.randint(0, self.params.n // 4, (5, 2))
+        self.array = EncryptedArray.Encrypt(self.params, self.keys.public_key, self.values,
+                                            self.path("array"), chunk_size=2)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def decrypt(self, array):
+        return array.Decrypt(self.params, self.keys.secret_key, workers=2).tolist()
+
+    def test_Encryption_and_Slicing(self):
+        self.assertEqual(self.array.chunks, 3)
+        self.assertEqual(self.decrypt(EncryptedArray(self.path("array"))), self.values.tolist())
+
+        self.assertEqual(self.decrypt(self.array.Slice(np.s_[1:4], self.path("rows"))), self.values[1:4].tolist())
+        self.assertEqual(self.decrypt(self.array.Slice(np.s_[::2, 1], self.path("column"))), self.values[::2, 1].tolist())
+        self.assertEqual(self.decrypt(self.array.Slice(2, self.path("row"))), self.values[2].tolist())
+        self.assertEqual(self.keys.secret_key.Decrypt(self.params, self.array[3, 1]), self.values[3, 1])
+
+    def test_Add_ConstMult_and_Sum(self):
+        const = 3
+        consts = np.random.randint(0, 4, self.values.shape)
+        consts[0, 0] = 0
+
+        array_add = self.array.Add(self.params, self.array, self.path("add"))
+        array_add_const = self.array.Add(self.params, const, self.path("add_const"))
+        array_constmult = self.array.ConstMult(self.params, consts, self.path("constmult"))
+
+        self.assertEqual(self.decrypt(array_add), (2 * self.values).tolist())
+        self.assertEqual(self.decrypt(array_add_const), (self.values + const).tolist())
+        self.assertEqual(self.decrypt(array_constmult), (self.values * consts).tolist())
+
+        self.assertEqual(self.keys.secret_key.Decrypt(self.params, self.array.Sum(self.params)), self.values.sum())
+        self.assertEqual(self.decrypt(self.array.Sum(self.params, 0, self.path("sum_0"))), self.values.sum(0).tolist())
+        self.assertEqual(self.decrypt(self.array.Sum(self.params, 1, self.path("sum_1"))), self.values.sum(1).tolist())
+
+    def test_Sum_of_wide_array(self):
+        # Sums along axis 0 are written by chunks of columns
+        values = np.random.randint(0, self.params.n // 8, (3, 5))
+        array = EncryptedArray.Encrypt(self.params, self.keys.public_key, values, self.path("wide"), chunk_size=2)
+
+        array_sum = array.Sum(self.params, 0, self.path("wide_sum"))
+
+        self.assertEqual(array_sum.chunks, 3)
+        self.assertEqual(self.decrypt(array_sum), values.sum(0).tolist())
+
+    def test_Temporary_store(self):
+        # Store of result without path is removed with its array object
+        array = self.array[1:3]
+        path = array.path
+        self.assertEqual(self.decrypt(array), self.values[1:3].tolist())
+
+        del array
+        gc.collect()
+        self.assertFalse(os.path.exists(path))
+
+        # or on exit of with block
+        with self.array.Add(self.params, 1) as array:
+            path = array.path
+            self.assertEqual(self.decrypt(array), (self.values + 1).tolist())
+        self.assertFalse(os.path.exists(path))
+
+    def test_Mult(self):
+        values = np.array([0, 2, 3])
+
+        params = GSWParams.Setup(LAMBDA_VALUE, max_message=3)
+        sk = GSWSecretKey.SecretKeyGen(params)
+        pk = GSWPublicKey.PublicKeyGen(params, sk)
+
+        array = EncryptedArray.Encrypt(params, pk, values, self.path("small"), chunk_size=2)
+        array_mult = array.Mult(params, array, self.path("mult"))
+
+        # Plaintext bounds are kept in store, so error bounds of productions stay in budget
+        self.assertEqual(array_mult[2].message_bound, 9)
+        self.assertEqual(array_mult.Decrypt(params, sk, workers=2, strict=True).tolist(), (values * values).tolist())
+
+
+class CircuitTest(TestCase):
+
+    def test_Balance(self):
+        params = GSWParams.Setup(LAMBDA_VALUE, L=3)
+
+        circuit = Circuit(params)
+        inputs = [circuit.Input(f"x{i}") for i in range(8)]
+
+        # Chain x0*x1*...*x7 has depth 7, but tree of the same multiplications has depth 3
+        product = inputs[0]
+        for gate in inputs[1:]:
+            product = circuit.Mult(product, gate)
+        circuit.Output(product, "product")
+
+        balanced = circuit.Balance()
+
+        self.assertEqual(circuit.Depth(), 7)
+        self.assertEqual(balanced.Depth(), 3)
+        self.assertEqual(len(balanced.CriticalPath()), 4)
+
+        # Not balanced circuit is too deep for params.L
+        with self.assertRaises(ValueError):
+            circuit.Evaluate({}, balance=False)
+
+    def test_Balance_keeps_operand_order(self):
+        circuit = Circuit(GSWParams.Setup(LAMBDA_VALUE, L=3))
+        x0, x1, x2, x3, selector = [circuit.Input(f"x{i}") for i in range(5)]
+
+        # Multiplication by shared selector is not a chain and is kept as is
+        for gate in (x0, x1):
+            circuit.Output(circuit.Mult(gate, selector), f"selected_{gate}")
+
+        # Chain operands are combined from left to right
+        circuit.Output(circuit.Mult(circuit.Mult(circuit.Mult(x0, x1), x2), x3), "product")
+
+        balanced = circuit.Balance()
+        inputs = lambda number: tuple(balanced.gates[i].name for i in balanced.gates[number].inputs)
+
+        self.assertEqual(inputs(balanced.outputs["selected_0"]), ("x0", "x4"))
+        self.assertEqual(inputs(balanced.outputs["selected_1"]), ("x1", "x4"))
+
+        left, right = balanced.gates[balanced.outputs["product"]].inputs
+        self.assertEqual((inputs(left), inputs(right)), (("x0", "x1"), ("x2", "x3")))
+
+    def test_Evaluate(self):
+        keys = GSWKeys(LAMBDA_VALUE)
+        messages = [randint(0, 1) for none in range(4)]
+        cts = keys.public_key.EncryptBatch(keys.params, messages)
+
+        circuit = Circuit(keys.params)
+        a, b, c, d = [circuit.Input(name) for name in "abcd"]
+
+        circuit.Output(circuit.ConstMult(circuit.Add(circuit.Add(circuit.Add(a, b), c), d), 2), "sum")
+        circuit.Output(circuit.Mult(a, b), "product")
+
+        outputs = circuit.Evaluate(dict(zip("abcd", cts)), workers=2)
+
+        self.assertEqual(keys.secret_key.Decrypt(keys.params, outputs["sum"], strict=True), 2 * sum(messages))
+        self.assertEqual(keys.secret_key.Decrypt(keys.params, outputs["product"], strict=True),
+                         messages[0] * messages[1])
+
+        # 4 inputs and 5 gates, but intermediate sums are freed after their last consumer
+        self.assertEqual(circuit.report["depth"], 1)
+        self.assertEqual(circuit.report["gates"], 5)
+        self.assertLess(circuit.report["peak_live"], 9)
+
+    @skipIf((os.cpu_count() or 1) < 2, "concurrent evaluation needs several cores")
+    def test_Evaluate_concurrency(self):
+        keys = GSWKeys(LAMBDA_VALUE)
+        cts = keys.public_key.EncryptBatch(keys.params, [1] * 8)
+
+        circuit = Circuit(keys.params)
+        inputs = [circuit.Input(f"x{i}") for i in range(8)]
+        for number in range(4):
+            circuit.Output(circuit.Mult(inputs[2 * number], inputs[2 * number + 1]), f"product_{number}")
+
+        def evaluation_time(workers):
+            start = time.perf_counter()
+            circuit.Evaluate({f"x{i}": ct for i, ct in enumerate(cts)}, workers=workers)
+            return time.perf_counter() - start
+
+        # Independent Mult gates are faster in parallel
+        serial = min(evaluation_time(1) for _ in range(3))
+        parallel = min(evaluation_time(4) for _ in range(3))
+        self.assertLess(parallel, serial)
+
+
+class DecompositionCacheTest(TestCase):
+
+    def setUp(self):
+        # Only decomposition is checked here, so small parameters are enough
+        self.keys = GSWKeys(5)
+        self.params = self.keys.params
+
+        self.cts = self.keys.public_key.EncryptBatch(self.params, [1, 0, 1])
+
+    def test_Mult(self):
+        cache = DecompositionCache()
+
+        # Second multiplication by the same ciphertext uses cached decomposition
+        expected = HomomorphicOperations.Mult(self.params, self.cts[0], self.cts[2])
+        first = HomomorphicOperations.Mult(self.params, self.cts[0], self.cts[2], cache)
+        second = HomomorphicOperations.Mult(self.params, self.cts[1], np.copy(self.cts[2]), cache)
+
+        self.assertTrue(np.array_equal(first, expected))
+        self.assertTrue(np.array_equal(second, HomomorphicOperations.Mult(self.params, self.cts[1], self.cts[2])))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_Circuit_Evaluate(self):
+        cts = self.keys.public_key.EncryptBatch(self.params, [1, 0, 1, 1, 1])
+
+        circuit = Circuit(self.params)
+        values = [circuit.Input(f"x{i}") for i in range(4)]
+        selector = circuit.Input("selector")
+        for number, value in enumerate(values):
+            circuit.Output(circuit.Mult(value, selector), f"selected_{number}")
+
+        inputs = dict(zip(["x0", "x1", "x2", "x3", "selector"], cts))
+        expected = [HomomorphicOperations.Mult(self.params, ct, cts[4]) for ct in cts[:4]]
+
+        # Concurrent gates wait for the first decomposition of selector instead of repeating it
+        for balance in (True, False):
+            cache = DecompositionCache()
+            outputs = circuit.Evaluate(inputs, workers=4, balance=balance, cache=cache)
+
+            self.assertEqual((cache.hits, cache.misses), (3, 1))
+            self.assertFalse(cache.pending)
+            for number in range(4):
+                self.assertTrue(np.array_equal(outputs[f"selected_{number}"], expected[number]))
+
+    def test_failed_Decompose(self):
+        cache = DecompositionCache()
+        started, release = threading.Event(), threading.Event()
+
+        def failing_decompose(params, matrix):
+            started.set()
+            release.wait()
+            raise MemoryError("decomposition failed")
+
+        def owner():
+            with self.assertRaises(MemoryError):
+                cache.Decompose(self.params, self.cts[0])
+
+        # Waiter of failed decomposition gets its error and is not counted as hit
+        with mock.patch.object(MatrixUtils, "GadgetDecompose", failing_decompose):
+            thread = threading.Thread(target=owner)
+            thread.start()
+            started.wait()
+            threading.Timer(0.2, release.set).start()
+            with self.assertRaises(MemoryError):
+                cache.Decompose(self.params, self.cts[0])
+            thread.join()
+
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+        self.assertFalse(cache.pending)
+
+        # Clear removes decompositions, but keeps counters
+        cache.Decompose(self.params, self.cts[0])
+        cache.Clear()
+        self.assertEqual((cache.hits, cache.misses, cache.bytes), (0, 2, 0))
+
+    def test_Eviction(self):
+        matrix = DecompositionCache().Decompose(self.params, self.cts[0])
+        entry_bytes = np.packbits(matrix.astype(np.uint8), axis=0).nbytes
+
+        # Cache with place for only one decomposition evicts the least recently used one
+        cache = DecompositionCache(max_bytes=entry_bytes)
+        cache.Decompose(self.params, self.cts[0])
+        cache.Decompose(self.params, self.cts[1])
+        cache.Decompose(self.params, self.cts[0])
+
+        self.assertEqual((cache.hits, cache.misses), (0, 3))
+        self.assertEqual(cache.bytes, entry_bytes)
+        self.assertTrue(np.array_equal(cache.Decompose(self.params, self.cts[0]), matrix))
+        self.assertEqual(cache.hits, 1)
+
+
 if __name__ == "__main__":
     main()
@@ -1,12 +1,18 @@
 """ pyGSW utility functions """
 
 from time import time
-from random import randint
+from collections import OrderedDict
+from concurrent.futures import Future
+from threading import Lock
 from scipy.linalg import block_diag
 
+import hashlib
 import numpy as np
 
 
+# Number of candidates, checked at once by gadget decoding
+DECODE_CHUNK_SIZE = 2**16
+
 start = None
 def status(msg):
     """Print time, that past from system work start and input message
@@ -23,54 +29,132 @@ def status(msg):
     print("%.4f  %s\n" % (now-start, msg))
 
 
+class RandomUtils(object):
+    """Random Generators functions Class"""
+
+    @staticmethod
+    def Generator(rng=None):
+        """Creating random generator from seed. Default bit generator is PCG64DXSM
+
+        :param rng: random generator, that is returned as is, or seed for new generator. Random seed if None
+        :type rng: np.random.Generator or int or np.random.SeedSequence
+        :return: random generator
+        :rtype: np.random.Generator
+        """
+
+        if isinstance(rng, np.random.Generator):
+            return rng
+        return np.random.Generator(np.random.PCG64DXSM(rng))
+
+    @staticmethod
+    def Spawn(rng, count):
+        """Creating independent random generators, e.g. one for every thread or process
+
+        :param rng: parent random generator or seed. Random seed if None
+        :type rng: np.random.Generator or int or np.random.SeedSequence
+        :param count: number of generators
+        :type count: int
+        :return: independent random generators
+        :rtype: list[np.random.Generator]
+        """
+
+        if isinstance(rng, np.random.Generator):
+            seed_sequence = np.random.SeedSequence(rng.integers(0, 2**63, size=4))
+        elif isinstance(rng, np.random.SeedSequence):
+            seed_sequence = rng
+        else:
+            seed_sequence = np.random.SeedSequence(rng)
+
+        return [np.random.Generator(np.random.PCG64DXSM(seed)) for seed in seed_sequence.spawn(count)]
+
+    @staticmethod
+    def RandomBits(rng, shape):
+        """Generating random binary matrix from packed random bytes
+
+        :param rng: random generator
+        :type rng: np.random.Generator
+        :param shape: matrix shape
+        :type shape: tuple
+        :return: matrix with random values from {0, 1}
+        :rtype: np.array
+        """
+
+        size = int(np.prod(shape))
+        bits = np.unpackbits(np.frombuffer(rng.bytes((size + 7) // 8), dtype=np.uint8), count=size)
+        return bits.reshape(shape)
+
+    @staticmethod
+    def RandomSigns(rng, shape):
+        """Generating random matrix with values from {-1, 1}
+
+        :param rng: random generator
+        :type rng: np.random.Generator
+        :param shape: matrix shape
+        :type shape: tuple
+        :return: matrix with random values from {-1, 1}
+        :rtype: np.array
+        """
+
+        return 2*RandomUtils.RandomBits(rng, shape).astype(np.int8) - 1
+
+
 class Prime(object):
     """Prime Digits Class"""
     
     @staticmethod
-    def is_prime(p):
+    def is_prime(p, rng=None):
         """Check whether p is probably prime
 
         :param p: testing number
         :type p: int
+        :param rng: random generator or seed
+        :type rng: np.random.Generator
         :return: p prime decision
         :rtype: bool
         """
 
+        rng = RandomUtils.Generator(rng)
         for _ in range(16):
-            a = randint(1, p-1)
+            a = int(rng.integers(1, p-1, endpoint=True))
             if pow(a, p-1, p) != 1:
                 return False
         return True
 
     @staticmethod
-    def gen_prime(b):
+    def gen_prime(b, rng=None):
         """Generating a prime p with b bits
 
         :param b: bit size of generating prime
         :type b: int
+        :param rng: random generator or seed
+        :type rng: np.random.Generator
         :return: probably prime number with b bits size
         :rtype: int
         """
 
-        p = randint(2**(b-1), 2**b)
-        while not Prime.is_prime(p):
-            p = randint(2**(b-1), 2**b)
+        rng = RandomUtils.Generator(rng)
+        p = int(rng.integers(2**(b-1), 2**b, endpoint=True))
+        while not Prime.is_prime(p, rng):
+            p = int(rng.integers(2**(b-1), 2**b, endpoint=True))
         return p
 
     @staticmethod
-    def generateSafePrime(k):
+    def generateSafePrime(k, rng=None):
         """Generating a safe Sophie Germain prime p with k bits
 
         :param k: bit size of generating Sophie Germain prime
         :type k: int
+        :param rng: random generator or seed
+        :type rng: np.random.Generator
         :return: probably prime, that is an safe Sophie Germain number with b bits size
         :rtype: int
         """
 
-        p = Prime.gen_prime(k-1)
+        rng = RandomUtils.Generator(rng)
+        p = Prime.gen_prime(k-1, rng)
         sp = 2*p + 1
-        while not Prime.is_prime(sp):
-            p = Prime.gen_prime(k-1)
+        while not Prime.is_prime(sp, rng):
+            p = Prime.gen_prime(k-1, rng)
             sp = 2*p + 1
         return sp
 
@@ -177,6 +261,25 @@ class MatrixUtils(object):
         x = np.asarray(x)
         return x
 
+    @staticmethod
+    def GadgetDecompose(params, matrix):
+        """Gadget decomposition G^(-1)(C) of n x m matrix, which column j is bit decomposition of column j of C.
+        Equal to BitDecompMatrix(params, C.T).T, but computed by numpy operations without Python loops
+
+        :param params: GSW scheme parameters
+        :type params: GSWParams
+        :param matrix: decomposable matrix n x m
+        :type matrix: np.array
+        :return: binary matrix n*l x m
+        :rtype: np.array
+        """
+
+        matrix = np.asarray(matrix, dtype=np.int64) % params.q
+        shifts = np.arange(params.l, dtype=np.int64)[np.newaxis, :, np.newaxis]
+
+        bits = (matrix[:, np.newaxis, :] >> shifts) & 1
+        return bits.astype(np.uint8).reshape(matrix.shape[0] * params.l, matrix.shape[1])
+
     @staticmethod
     def Powerof2(params, vector):
         """Convert input k-size vector to k*l-size vector
@@ -225,6 +328,77 @@ class MatrixUtils(object):
 
         return MatrixUtils.BitDecompMatrix(params, MatrixUtils.BitDecompInverseMatrix(params, matrix))
 
+    @staticmethod
+    def GadgetDecode(params, vector):
+        """Recover integer mu from l-size vector (mu, mu*2, ..., mu*2^(l-1)) + error as best distance number.
+        Every value of vector with error lower than q/4 narrows intervals of possible mu,
+        then the rest candidates are checked by distance
+
+        :param params: GSW scheme parameters
+        :type params: GSWParams
+        :param vector: decoding vector with error
+        :type vector: np.array
+        :return: integer mu from Z_q
+        :rtype: int
+        """
+
+        q = params.q
+        bound = q // 4
+
+        intervals = [(0, q - 1)]
+        for i, value in enumerate(vector):
+            weight, value = 2**i, int(value)
+
+            # weight*mu must be in [value - bound + j*q, value + bound + j*q] for some integer j
+            narrowed = []
+            for low, high in intervals:
+                for j in range((weight*low - value - bound) // q, (weight*high - value + bound) // q + 1):
+                    new_low = max(low, -((bound - value - j*q) // weight))
+                    new_high = min(high, (value + bound + j*q) // weight)
+                    if new_low <= new_high:
+                        narrowed.append((new_low, new_high))
+
+            # Error of this value exceeds q/4, so it is not used
+            if narrowed:
+                intervals = narrowed
+
+        g = 2**np.arange(params.l, dtype=np.int64)
+
+        best_number = 0
+        best_dist = float('inf')
+        for low, high in intervals:
+            for start in range(low, high + 1, DECODE_CHUNK_SIZE):
+                candidates = np.arange(start, min(start + DECODE_CHUNK_SIZE, high + 1), dtype=np.int64)
+
+                dist = (np.asarray(vector) - np.outer(candidates, g)) % q
+                dist = np.minimum(dist, q - dist)
+                dist = np.sum(dist * dist, axis=1)
+
+                if dist.min() < best_dist:
+                    best_number = int(candidates[np.argmin(dist)])
+                    best_dist = dist.min()
+
+        return best_number
+
+    @staticmethod
+    def ModDot(params, a, b):
+        """Matrix production of a and b modulo q. Uses float64 production, if its result is exact
+
+        :param params: GSW scheme parameters
+        :type params: GSWParams
+        :param a: left integer matrix
+        :type a: np.array
+        :param b: right integer matrix
+        :type b: np.array
+        :return: integer matrix (a x b) mod q
+        :rtype: np.array
+        """
+
+        bound = a.shape[-1] * int(np.abs(a).max(initial=0)) * int(np.abs(b).max(initial=0))
+        if bound < 2**53:
+            return np.dot(a.astype(np.float64), b.astype(np.float64)).astype(np.int64) % params.q
+        return np.dot(a, b) % params.q
+
     @staticmethod
     def buildGadget(params):
         """Generating gadget matrix for GSW operations
@@ -237,3 +411,110 @@ class MatrixUtils(object):
 
         g = 2**np.arange(params.l)
         return block_diag(*[g for null in range(params.n)])
+
+
+class DecompositionCache(object):
+    """Cache of gadget decompositions G^(-1)(C) of ciphertexts, multiplied from the right side.
+    Decompositions are kept in packed bit form and found by ciphertext content hash.
+    The least recently used decompositions are evicted, when cache exceeds byte budget.
+    Concurrent requests of the same ciphertext wait for the first decomposition
+
+    :arg max_bytes: max size of packed decompositions in bytes
+    :type max_bytes: int
+    :return: None
+    """
+
+    def __init__(self, max_bytes: int=2**28):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+        self.entries = OrderedDict()
+        self.pending = {}
+        self.lock = Lock()
+
+    def __str__(self) -> str:
+        return f"DecompositionCache(entries = {len(self.entries)}, bytes = {self.bytes}, " \
+               f"hits = {self.hits}, misses = {self.misses})"
+
+    @staticmethod
+    def Key(params, ciphertext):
+        """Content hash of ciphertext
+
+        :param params: GSW scheme parameters
+        :type params: GSWParams
+        :param ciphertext: ciphertext matrix
+        :type ciphertext: np.array
+        :return: hash of parameters, ciphertext shape and values
+        :rtype: bytes
+        """
+
+        ciphertext = np.ascontiguousarray(ciphertext, dtype=np.int64)
+
+        digest = hashlib.blake2b(repr((params.q, params.l, ciphertext.shape)).encode())
+        digest.update(ciphertext.data)
+        return digest.digest()
+
+    def Decompose(self, params, ciphertext):
+        """Gadget decomposition G^(-1)(C), which column j is bit decomposition of column j of C
+
+        :param params: GSW scheme parameters
+        :type params: GSWParams
+        :param ciphertext: ciphertext matrix n x m
+        :type ciphertext: np.array
+        :return: binary matrix N x m
+        :rtype: np.array
+        """
+
+        key = DecompositionCache.Key(params, ciphertext)
+
+        with self.lock:
+            packed = self.entries.get(key)
+            pending = self.pending.get(key)
+            if packed is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+            elif pending is None:
+                self.misses += 1
+                self.pending[key] = Future()
+
+        if packed is not None:
+            return np.unpackbits(packed, axis=0, count=params.N)
+        if pending is not None:
+            # Other thread decomposes the same ciphertext now, waiter is a hit only if decomposition succeeds
+            packed = pending.result()
+            with self.lock:
+                self.hits += 1
+            return np.unpackbits(packed, axis=0, count=params.N)
+
+        try:
+            matrix = MatrixUtils.GadgetDecompose(params, ciphertext)
+            packed = np.packbits(matrix, axis=0)
+        except BaseException as exc:
+            with self.lock:
+                self.pending.pop(key).set_exception(exc)
+            raise
+
+        with self.lock:
+            self.pending.pop(key).set_result(packed)
+
+            if key not in self.entries and packed.nbytes <= self.max_bytes:
+                self.entries[key] = packed
+                self.bytes += packed.nbytes
+
+                while self.bytes > self.max_bytes:
+                    _, evicted = self.entries.popitem(last=False)
+                    self.bytes -= evicted.nbytes
+
+        return matrix
+
+    def Clear(self):
+        """Removing all decompositions from cache. Hits and misses counters are kept
+
+        :return: None
+        """
+
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
@@ -3,7 +3,7 @@ from setuptools import setup, find_packages
 with open("README.md", "r") as readme_file:
     readme = readme_file.read()
 
-requirements = ["numpy>=1.18.0", "scipy>=1.3.3"]
+requirements = ["numpy>=1.21.0", "scipy>=1.3.3"]
 
 setup(
     name="pyGSW",